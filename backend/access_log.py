@@ -0,0 +1,167 @@
+"""Request IDs, structured access logging and non-blocking log output.
+
+`AccessLogMiddleware` assigns each request an id (reusing an inbound
+`X-Request-ID`), echoes it in the response and emits one JSON line per
+request on the `access` logger: route template, user, status, total time,
+time spent in Mongo and bytes sent.
+
+All logging goes through a `QueueHandler`; a `QueueListener` thread does the
+formatting and writing, so handlers never block the event loop.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+from metrics import route_template
+
+REQUEST_ID_HEADER = b"x-request-id"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+access_logger = logging.getLogger("access")
+
+
+class RequestStats:
+    """Per-request accumulator shared with Motor's executor threads via contextvars."""
+
+    __slots__ = ("request_id", "user", "db_ms", "db_commands", "_lock")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.user = None
+        self.db_ms = 0.0
+        self.db_commands = 0
+        self._lock = threading.Lock()
+
+    def add_db_time(self, duration_ms: float):
+        with self._lock:
+            self.db_ms += duration_ms
+            self.db_commands += 1
+
+
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def set_request_user(username: str):
+    stats = request_stats.get()
+    if stats is not None:
+        stats.user = username
+
+
+class DbTimeListener(monitoring.CommandListener):
+    """Adds each Mongo command's duration to the current request's stats.
+
+    Motor runs driver calls with a copy of the caller's context, so the
+    request's RequestStats is visible from the driver thread.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        stats = request_stats.get()
+        if stats is not None:
+            stats.add_db_time(event.duration_micros / 1000)
+
+
+class AccessLogMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inbound = dict(scope["headers"]).get(REQUEST_ID_HEADER, b"").decode("latin-1").strip()
+        request_id = inbound[:128] or uuid.uuid4().hex
+        stats = RequestStats(request_id)
+        token = request_stats.set(stats)
+        status_code = 500
+        bytes_out = 0
+        started = time.perf_counter()
+        # Taken when the last body chunk is sent, so BackgroundTasks are not counted
+        finished = None
+
+        async def send_wrapper(message):
+            nonlocal status_code, bytes_out, finished
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode("latin-1"))],
+                }
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = (time.perf_counter(), stats.db_ms, stats.db_commands)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_stats.reset(token)
+            ended, db_ms, db_commands = finished or (time.perf_counter(), stats.db_ms, stats.db_commands)
+            client = scope.get("client")
+            access_logger.info("access", extra={"access": {
+                "request_id": request_id,
+                "method": scope["method"],
+                "route": route_template(scope),
+                "path": scope["path"],
+                "status": status_code,
+                "user": stats.user,
+                "duration_ms": round((ended - started) * 1000, 3),
+                "db_ms": round(db_ms, 3),
+                "db_commands": db_commands,
+                "bytes_out": bytes_out,
+                "client": client[0] if client else None,
+            }})
+
+
+class JsonAccessFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            **getattr(record, "access", {}),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _is_access(record) -> bool:
+    return hasattr(record, "access")
+
+
+def configure_logging(level=logging.INFO):
+    """Route all logging through a queue drained by a background listener thread."""
+    log_queue = queue.SimpleQueue()
+
+    text_handler = logging.StreamHandler()
+    text_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    text_handler.addFilter(lambda record: not _is_access(record))
+
+    access_handler = logging.StreamHandler()
+    access_handler.setFormatter(JsonAccessFormatter())
+    access_handler.addFilter(_is_access)
+
+    listener = logging.handlers.QueueListener(log_queue, text_handler, access_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+    return listener
@@ -0,0 +1,101 @@
+"""Archival job for completed equipment.
+
+Equipment that has been "Recibido" and untouched for more than N months is
+moved from `equipment` into `equipment_archive`, so the hot collection and
+its indexes only hold units that are still in the workflow. Archived units
+stay searchable through GET /api/equipos/archivo.
+
+Each batch is copied first (upsert by id, so a rerun after a crash is safe)
+and only then deleted from `equipment`, with the same age filter: a unit
+edited between the two steps stays in `equipment` and its archive copy is
+dropped again.
+
+Usage (from the backend directory):
+    python archive_equipment.py [--months 12] [--batch-size 1000] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime
+
+from pymongo import ReplaceOne
+
+import database
+
+
+def default_months() -> int:
+    return int(os.environ.get("ARCHIVE_AFTER_MONTHS", "12"))
+
+
+def months_before(moment: datetime, months: int) -> datetime:
+    month_index = moment.year * 12 + moment.month - 1 - months
+    year, month = divmod(month_index, 12)
+    # Clamp the day for shorter months (e.g. 31 March - 1 month -> 28/29 February)
+    day = moment.day
+    while True:
+        try:
+            return moment.replace(year=year, month=month + 1, day=day)
+        except ValueError:
+            day -= 1
+
+
+def archivable_filter(months: int, now: datetime = None) -> dict:
+    cutoff = months_before(now or datetime.utcnow(), months)
+    # Soft-deleted units are left for the TTL purge (same predicate as server.NOT_DELETED)
+    return {"estado": "Recibido", "updated_at": {"$lt": cutoff}, "deleted_at": None}
+
+
+async def archive_completed_equipment(
+    database, months: int, batch_size: int = 1000, dry_run: bool = False, context=None
+) -> dict:
+    """Archive in batches; `context` (a jobs.JobContext) gets progress and may cancel between batches."""
+    query = archivable_filter(months)
+    stats = {"cutoff": query["updated_at"]["$lt"], "archived": 0, "skipped": 0}
+    if dry_run:
+        stats["archived"] = await database.equipment.count_documents(query)
+        return stats
+
+    while True:
+        batch = await database.equipment.find(query, {"_id": 0}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        archived_at = datetime.utcnow()
+        await database.equipment_archive.bulk_write(
+            [ReplaceOne({"id": eq["id"]}, {**eq, "archived_at": archived_at}, upsert=True) for eq in batch],
+            ordered=False
+        )
+        ids = [eq["id"] for eq in batch]
+        result = await database.equipment.delete_many({**query, "id": {"$in": ids}})
+        stats["archived"] += result.deleted_count
+        if result.deleted_count < len(ids):
+            # Edited since the read: keep the live copy only
+            still_live = await database.equipment.distinct("id", {"id": {"$in": ids}})
+            await database.equipment_archive.delete_many({"id": {"$in": still_live}})
+            stats["skipped"] += len(still_live)
+        if context:
+            await context.report(archivados=stats["archived"], omitidos=stats["skipped"])
+            await context.check_cancelled()
+        if result.deleted_count == 0:
+            break
+    return stats
+
+
+async def main(months: int, batch_size: int, dry_run: bool):
+    db = await database.connect()
+    try:
+        stats = await archive_completed_equipment(db, months, batch_size, dry_run)
+    finally:
+        database.close()
+    prefix = "[dry-run] " if dry_run else ""
+    print(f"{prefix}Recibidos antes de: {stats['cutoff']:%Y-%m-%d}")
+    print(f"{prefix}Equipos archivados: {stats['archived']}")
+    print(f"{prefix}Equipos omitidos (modificados durante el archivado): {stats['skipped']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archiva equipos recibidos hace más de N meses")
+    parser.add_argument("--months", type=int, default=default_months())
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.months, args.batch_size, args.dry_run))
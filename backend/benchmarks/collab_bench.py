@@ -0,0 +1,102 @@
+"""Fan-out cost of the collaboration hub.
+
+Joins N fake connections to one room (each one's `send` just records the
+arrival time, or sleeps to simulate a slow browser), broadcasts lock
+messages and measures how long it takes for every connection to receive
+each one. Also times a heartbeat sweep, checks that a stalled client is
+dropped without delaying the others, and that every connection can leave
+after a sweep has timed it out.
+
+Usage (from the backend directory):
+    python -m benchmarks.collab_bench [--sizes 10 100 1000] [--messages 200] [--slow 1]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import collab
+from benchmarks.load_test import percentile
+
+
+async def fan_out(size: int, messages: int, slow: int) -> dict:
+    hub = collab.CollaborationHub()
+    state = {"pending": 0, "last": 0.0, "done": asyncio.Event()}
+    closed = []
+
+    def make_send(is_slow: bool):
+        async def send(payload: bytes):
+            if is_slow:
+                await asyncio.sleep(3600)
+            state["pending"] -= 1
+            if state["pending"] == 0:
+                state["last"] = time.perf_counter()
+                state["done"].set()
+        return send
+
+    def make_close(index: int):
+        async def close(code: int):
+            closed.append((index, code))
+        return close
+
+    connections = []
+    for index in range(size):
+        connections.append(await hub.join(
+            "BENCH", f"tecnico-{index}", make_send(index < slow), make_close(index)
+        ))
+        # Real joins are spread out; give the sender tasks a chance to drain
+        await asyncio.sleep(0)
+    # Let the snapshots and presence broadcasts drain
+    await asyncio.sleep(0.05)
+
+    sender = connections[-1]
+    broadcast_ms = []
+    latencies = []
+    for i in range(messages):
+        state["pending"] = sum(1 for connection in connections[slow:] if not connection.closed)
+        state["done"].clear()
+        started = time.perf_counter()
+        hub.lock(sender, [f"EQ-{i}"])
+        broadcast_ms.append((time.perf_counter() - started) * 1000)
+        await state["done"].wait()
+        latencies.append((state["last"] - started) * 1000)
+
+    started = time.perf_counter()
+    await hub.sweep()
+    sweep_ms = (time.perf_counter() - started) * 1000
+
+    # Time everyone out, then disconnect them all: leave() must not wait on closed connections
+    await hub.sweep(now=time.monotonic() + collab.HEARTBEAT_TIMEOUT_SECONDS + 1)
+    started = time.perf_counter()
+    await asyncio.wait_for(asyncio.gather(*[hub.leave(connection) for connection in connections]), timeout=10)
+    leave_ms = (time.perf_counter() - started) * 1000
+    if hub.rooms or any(not connection.sender_task.done() for connection in connections):
+        raise RuntimeError("leave() left rooms or sender tasks behind")
+
+    broadcast_ms.sort()
+    latencies.sort()
+    return {
+        "connections": size,
+        "slow_connections": slow,
+        "messages": messages,
+        "broadcast_p50_ms": round(percentile(broadcast_ms, 50), 4),
+        "broadcast_p99_ms": round(percentile(broadcast_ms, 99), 4),
+        "all_delivered_p50_ms": round(percentile(latencies, 50), 4),
+        "all_delivered_p99_ms": round(percentile(latencies, 99), 4),
+        "heartbeat_sweep_ms": round(sweep_ms, 4),
+        "leave_after_timeout_ms": round(leave_ms, 4),
+        "dropped_slow": len({index for index, code in closed if code == collab.CLOSE_TRY_AGAIN_LATER}),
+    }
+
+
+async def main(args):
+    results = [await fan_out(size, args.messages, min(args.slow, size - 1)) for size in args.sizes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el reparto de mensajes del hub de colaboración")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--slow", type=int, default=1, help="conexiones que nunca leen")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""Bytes saved by response compression on the heaviest payloads.
+
+Builds the JSON body `/api/equipos` returns and the body of
+`/ordenes-compra/{n}/export-csv` for synthetic equipment, then compresses
+both with every available encoding at the configured levels.
+
+Usage (from the backend directory):
+    python -m benchmarks.compression_bench [--count 1000] [--seed 1] [--kbps 2000]
+"""
+import argparse
+import random
+import time
+
+import orjson
+
+import compression
+import packing_list
+from benchmarks import dataset
+
+
+def synthetic_equipment(count: int, rng: random.Random) -> list:
+    reference = dataset.make_reference_data(rng)
+    clients = [dataset.make_client(rng, i) for i in range(max(50, count // 20))]
+    equipment = []
+    for batch, _ in dataset.iter_equipment_batches(rng, count, clients, reference["models"]):
+        equipment.extend(batch)
+    return equipment
+
+
+def export_body(equipment: list) -> bytes:
+    # Same shape as export_purchase_order_csv's response
+    return orjson.dumps({
+        "filename": "orden_compra_bench.csv",
+        "content": packing_list.render_csv(packing_list.equipment_rows(equipment)),
+        "equipment_count": len(equipment),
+    })
+
+
+def measure(name: str, body: bytes, kbps: int) -> list:
+    results = [{"payload": name, "encoding": "identity", "bytes": len(body), "compress_ms": 0.0}]
+    encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    middleware = compression.CompressionMiddleware(None)
+    for encoding in encodings:
+        started = time.perf_counter()
+        compressed = compression.compress_bytes(
+            body, encoding, middleware.gzip_level, middleware.brotli_quality
+        )
+        results.append({
+            "payload": name,
+            "encoding": encoding,
+            "bytes": len(compressed),
+            "compress_ms": (time.perf_counter() - started) * 1000,
+        })
+    for result in results:
+        result["saved_pct"] = 100 * (1 - result["bytes"] / len(body))
+        result["transfer_ms"] = result["bytes"] * 8 / kbps
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el ahorro de bytes de la compresión de respuestas")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--kbps", type=int, default=2000, help="ancho de banda simulado del cliente")
+    args = parser.parse_args()
+
+    equipment = synthetic_equipment(args.count, random.Random(args.seed))
+    results = measure("/api/equipos", orjson.dumps(equipment), args.kbps)
+    results += measure("export-csv", export_body(equipment), args.kbps)
+
+    print(f"{'payload':<14}{'encoding':<10}{'bytes':>12}{'saved':>9}{'compress':>12}{'transfer':>12}")
+    for r in results:
+        print(
+            f"{r['payload']:<14}{r['encoding']:<10}{r['bytes']:>12,}{r['saved_pct']:>8.1f}%"
+            f"{r['compress_ms']:>10.1f}ms{r['transfer_ms']:>10.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Synthetic documents shaped like production data.
+
+Everything is driven by a seeded `random.Random`, so the same seed always
+produces the same dataset. Documents are built as plain dicts matching the
+models in server.py (and the fields the write paths add, such as client
+search keys) so large datasets can be generated without model overhead.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from server import client_search_keys
+
+ESTADOS = ["Pendiente", "Enviado", "En Fabricante", "Recibido"]
+# Rough production mix: most equipment is already back from the manufacturer
+ESTADO_WEIGHTS = [15, 10, 15, 60]
+FABRICANTES = ["DRAEGER", "MSA", "HONEYWELL", "INTERSPIRO", "SCOTT", "INDUSTRIAL SCIENTIFIC"]
+TIPOS_EQUIPO = ["Espaldera", "Mascara", "Regulador", "Detector Portátil de Gas", "SLS", "Module Control"]
+# Same defaults get_fault_types seeds
+TIPOS_FALLO = [
+    ("SENSOR LEAKING ACID, PCB DAMAGED", True),
+    ("SENSOR FAILURE", True),
+    ("AIR LEAK", False),
+    ("LOW SOUND", False),
+    ("OTHER", False),
+]
+CIUDADES = ["MADRID", "BARCELONA", "BILBAO", "SEVILLA", "VALENCIA", "GIJÓN", "A CORUÑA", "ZARAGOZA"]
+EPOCH = datetime(2024, 1, 1)
+
+
+def make_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def make_reference_data(rng: random.Random) -> dict:
+    models = [
+        {"id": make_uuid(rng), "nombre": f"{tipo[:3].upper()}-{n:02d}", "tipo_equipo": tipo, "deleted_at": None}
+        for tipo in TIPOS_EQUIPO for n in range(1, 6)
+    ]
+    return {
+        "manufacturers": [{"id": make_uuid(rng), "nombre": nombre, "deleted_at": None} for nombre in FABRICANTES],
+        "models": models,
+        "fault_types": [
+            {"id": make_uuid(rng), "nombre": nombre, "requiere_sensor": sensor, "deleted_at": None}
+            for nombre, sensor in TIPOS_FALLO
+        ],
+    }
+
+
+def make_client(rng: random.Random, index: int) -> dict:
+    nombre = f"CLIENTE {index:06d} {rng.choice(CIUDADES)} S.A."
+    cif = f"B{rng.randint(10**7, 10**8 - 1)}"
+    # A long tail of clients with many sites, like the utilities in production
+    centros = rng.choice([1, 1, 2, 3, 5, 8, 15, 30])
+    return {
+        "id": make_uuid(rng),
+        "nombre": nombre,
+        "cif": cif,
+        "telefono": f"9{rng.randint(10**7, 10**8 - 1)}",
+        "email": f"contacto{index}@cliente.example",
+        "centros_trabajo": [
+            {
+                "id": make_uuid(rng),
+                "nombre": f"CENTRO {n + 1} {rng.choice(CIUDADES)}",
+                "direccion": f"Calle {rng.randint(1, 200)}, {rng.choice(CIUDADES)}",
+                "telefono": f"9{rng.randint(10**7, 10**8 - 1)}",
+            }
+            for n in range(centros)
+        ],
+        "created_at": EPOCH + timedelta(minutes=rng.randint(0, 10**6)),
+        "version": 0,
+        "deleted_at": None,
+        **client_search_keys(nombre, cif),
+    }
+
+
+def make_equipment(rng: random.Random, index: int, client: dict, models: list, po_number) -> dict:
+    # Equipment only leaves "Pendiente" once it is on a purchase order
+    estado = rng.choices(ESTADOS[1:], ESTADO_WEIGHTS[1:])[0] if po_number else "Pendiente"
+    model = rng.choice(models)
+    centro = rng.choice(client["centros_trabajo"])
+    fallo, requiere_sensor = rng.choice(TIPOS_FALLO)
+    created = EPOCH + timedelta(minutes=rng.randint(0, 10**6))
+    document = {
+        "id": make_uuid(rng),
+        "orden_trabajo": f"OT-{index:08d}",
+        "cliente_id": client["id"],
+        "cliente_nombre": client["nombre"],
+        "centro_trabajo_id": centro["id"],
+        "centro_trabajo_nombre": centro["nombre"],
+        "tipo_equipo": model["tipo_equipo"],
+        "modelo": model["nombre"],
+        "ato": None,
+        "fabricante": rng.choice(FABRICANTES),
+        "numero_serie": f"SN{rng.randint(10**9, 10**10 - 1)}",
+        "fecha_fabricacion": created - timedelta(days=rng.randint(365, 3650)),
+        "tipo_fallo": fallo,
+        "observaciones": None,
+        "numero_serie_sensor": f"SS{rng.randint(10**6, 10**7 - 1)}" if requiere_sensor else None,
+        "fecha_instalacion_sensor": created - timedelta(days=rng.randint(30, 700)) if requiere_sensor else None,
+        "estado": estado,
+        "numero_orden_compra": po_number,
+        "numero_recepcion_fabricante": None,
+        "en_garantia": None,
+        "numero_presupuesto": None,
+        "presupuesto_aceptado": None,
+        "created_at": created,
+        "updated_at": created + timedelta(days=rng.randint(0, 90)),
+        "version": 0,
+        "deleted_at": None,
+    }
+    if estado in ("En Fabricante", "Recibido"):
+        document["numero_recepcion_fabricante"] = f"RMA{rng.randint(10**5, 10**6 - 1)}"
+        document["en_garantia"] = rng.random() < 0.6
+        if not document["en_garantia"]:
+            document["numero_presupuesto"] = f"PRES-{rng.randint(1000, 9999)}"
+            document["presupuesto_aceptado"] = rng.random() < 0.8
+    return document
+
+
+def iter_equipment_batches(rng: random.Random, count: int, clients: list, models: list,
+                           batch_size: int = 1000, start_index: int = 0, po_size=(12, 48)):
+    """Yield (equipment batch, purchase orders completed in it).
+
+    Equipment is assigned to purchase orders of po_size units; pending units
+    (no PO yet) are drawn at the ESTADO_WEIGHTS rate.
+    """
+    batch = []
+    orders = []
+    current_po = None
+    po_remaining = 0
+    pending_share = ESTADO_WEIGHTS[0] / sum(ESTADO_WEIGHTS)
+    for index in range(start_index, start_index + count):
+        if rng.random() < pending_share:
+            po_number = None
+        else:
+            if po_remaining == 0:
+                if current_po:
+                    orders.append(current_po)
+                current_po = {
+                    "id": make_uuid(rng),
+                    "numero_orden": f"PO-{start_index:09d}-{index:09d}",
+                    "equipments": [],
+                    "created_at": EPOCH + timedelta(minutes=rng.randint(0, 10**6)),
+                }
+                po_remaining = rng.randint(*po_size)
+            po_number = current_po["numero_orden"]
+            po_remaining -= 1
+        document = make_equipment(rng, index, rng.choice(clients), models, po_number)
+        if po_number:
+            current_po["equipments"].append(document["id"])
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch, orders
+            batch, orders = [], []
+    if current_po and current_po["equipments"]:
+        orders.append(current_po)
+    if batch or orders:
+        yield batch, orders
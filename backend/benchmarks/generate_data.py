@@ -0,0 +1,123 @@
+"""Generate a large, production-shaped dataset directly into MongoDB.
+
+Clients and reference data are generated in the main process; equipment and
+purchase orders are generated in chunks by a pool of worker processes, each
+writing its own `insert_many` batches. Every chunk has its own RNG derived
+from --seed and the chunk number, so the same arguments always produce the
+same data regardless of --workers.
+
+Usage (from the backend directory):
+    python -m benchmarks.generate_data --equipment 1000000 [--clients 20000]
+        [--db perf_data] [--workers 4] [--batch-size 5000] [--seed 1] [--drop]
+
+The target database defaults to DB_NAME from .env. Indexes are left to the
+app: it provisions them at startup, which is faster than maintaining them
+during the bulk load.
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pymongo import MongoClient
+
+import database  # noqa: F401  (loads backend/.env)
+from benchmarks import dataset
+
+CHUNK_SIZE = 50_000
+
+_worker_state = {}
+
+
+def _init_worker(mongo_url: str, db_name: str, clients: list, models: list):
+    _worker_state["db"] = MongoClient(mongo_url, maxPoolSize=2)[db_name]
+    _worker_state["clients"] = clients
+    _worker_state["models"] = models
+
+
+def _generate_chunk(seed: int, chunk_index: int, count: int, batch_size: int) -> tuple:
+    db = _worker_state["db"]
+    rng = random.Random(f"{seed}-equipment-{chunk_index}")
+    equipment = 0
+    orders = 0
+    for batch, completed_orders in dataset.iter_equipment_batches(
+        rng, count, _worker_state["clients"], _worker_state["models"],
+        batch_size=batch_size, start_index=chunk_index * CHUNK_SIZE
+    ):
+        if batch:
+            db.equipment.insert_many(batch, ordered=False)
+            equipment += len(batch)
+        if completed_orders:
+            db.purchase_orders.insert_many(completed_orders, ordered=False)
+            orders += len(completed_orders)
+    return equipment, orders
+
+
+def _insert_batched(collection, documents: list, batch_size: int):
+    for start in range(0, len(documents), batch_size):
+        collection.insert_many(documents[start:start + batch_size], ordered=False)
+
+
+def main(args):
+    mongo_url = os.environ['MONGO_URL']
+    db_name = args.db or os.environ['DB_NAME']
+    client = MongoClient(mongo_url)
+    db = client[db_name]
+    if args.drop:
+        client.drop_database(db_name)
+
+    started = time.perf_counter()
+    rng = random.Random(f"{args.seed}-base")
+    reference = dataset.make_reference_data(rng)
+    db.manufacturers.insert_many(reference["manufacturers"])
+    db.models.insert_many(reference["models"])
+    db.fault_types.insert_many(reference["fault_types"])
+
+    client_count = args.clients or max(50, args.equipment // 50)
+    clients = [dataset.make_client(rng, i) for i in range(client_count)]
+    # insert_many adds _id to each dict; workers get a copy without it
+    worker_clients = [
+        {key: client[key] for key in ("id", "nombre", "centros_trabajo")} for client in clients
+    ]
+    _insert_batched(db.clients, clients, args.batch_size)
+    print(f"Clientes: {client_count} en {time.perf_counter() - started:.1f}s")
+
+    chunks = [
+        (index, min(CHUNK_SIZE, args.equipment - index * CHUNK_SIZE))
+        for index in range((args.equipment + CHUNK_SIZE - 1) // CHUNK_SIZE)
+    ]
+    equipment_total = 0
+    orders_total = 0
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(mongo_url, db_name, worker_clients, reference["models"]),
+    ) as pool:
+        futures = [
+            pool.submit(_generate_chunk, args.seed, index, count, args.batch_size)
+            for index, count in chunks
+        ]
+        for future in as_completed(futures):
+            equipment, orders = future.result()
+            equipment_total += equipment
+            orders_total += orders
+            elapsed = time.perf_counter() - started
+            print(f"Equipos: {equipment_total}/{args.equipment} ({equipment_total / elapsed:,.0f}/s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"Listo: {client_count} clientes, {equipment_total} equipos, "
+          f"{orders_total} órdenes de compra en {elapsed:.1f}s ({db_name})")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos a gran escala en MongoDB")
+    parser.add_argument("--equipment", type=int, default=100_000)
+    parser.add_argument("--clients", type=int, help="por defecto, un cliente por cada 50 equipos")
+    parser.add_argument("--db", help="base de datos destino (por defecto DB_NAME)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--drop", action="store_true", help="borrar la base de datos antes de generar")
+    main(parser.parse_args())
@@ -0,0 +1,266 @@
+"""In-process load test for the main API routes.
+
+Runs the FastAPI app through httpx's ASGI transport (no network, no
+uvicorn) against either a local mongod or mongomock-motor, seeds synthetic
+data at the requested scale, drives each route with concurrent requests and
+prints p50/p95/p99 latency and throughput as JSON, so runs can be diffed.
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test --scale 10k [--backend mongod|mongomock]
+        [--concurrency 16] [--requests 200] [--seed 1] [--output results.json] [--keep]
+
+With --backend mongod, MONGO_URL from .env is used with a separate
+database (bench_<scale>), dropped at the end unless --keep is given.
+mongomock needs `pip install mongomock-motor` and measures app overhead only.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+import database
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+USERNAME = "admin"
+PASSWORD = "ASCb33388091_"
+EQUIPMENT_PER_REQUEST = 5
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def bind_database(backend: str, db_name: str):
+    os.environ["DB_NAME"] = db_name
+    if backend == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+        database.client = AsyncMongoMockClient()
+        database.db.bind(database.client[db_name])
+
+
+async def seed(db, equipment_count: int, seed_value: int) -> dict:
+    from benchmarks import dataset
+
+    rng = random.Random(seed_value)
+    reference = dataset.make_reference_data(rng)
+    await db.manufacturers.insert_many(reference["manufacturers"])
+    await db.models.insert_many(reference["models"])
+    await db.fault_types.insert_many(reference["fault_types"])
+
+    clients = [dataset.make_client(rng, i) for i in range(max(50, equipment_count // 20))]
+    await db.clients.insert_many([dict(client) for client in clients])
+
+    for batch, orders in dataset.iter_equipment_batches(rng, equipment_count, clients, reference["models"]):
+        if batch:
+            await db.equipment.insert_many(batch)
+        if orders:
+            await db.purchase_orders.insert_many(orders)
+
+    pending = await db.equipment.find({"estado": "Pendiente"}, {"_id": 0, "id": 1}).to_list(None)
+    orders = await db.purchase_orders.find({}, {"_id": 0, "numero_orden": 1}).limit(500).to_list(500)
+    return {
+        "pending_ids": [eq["id"] for eq in pending],
+        "po_numbers": [order["numero_orden"] for order in orders],
+        "client_prefixes": [client["nombre"][:10] for client in clients[:200]],
+    }
+
+
+def build_scenarios(fixtures: dict, total: int):
+    """Ordered (name, request factory, request count); write scenarios feed each other."""
+    pending_ids = fixtures["pending_ids"]
+    assignments = []
+
+    def assigned_ids(i):
+        return pending_ids[i * EQUIPMENT_PER_REQUEST:(i + 1) * EQUIPMENT_PER_REQUEST]
+
+    async def login(client, headers, i):
+        return await client.post("/api/auth/login", json={"username": USERNAME, "password": PASSWORD})
+
+    async def list_equipment(client, headers, i):
+        return await client.get("/api/equipos", headers=headers)
+
+    async def list_pending(client, headers, i):
+        return await client.get("/api/equipos/pendientes", headers=headers)
+
+    async def list_reception(client, headers, i):
+        return await client.get("/api/equipos/para-recepcion", headers=headers)
+
+    async def list_clients_compact(client, headers, i):
+        return await client.get("/api/clientes", params={"view": "compact"}, headers=headers)
+
+    async def suggest_clients(client, headers, i):
+        prefixes = fixtures["client_prefixes"]
+        return await client.get("/api/clientes/sugerir", params={"q": prefixes[i % len(prefixes)]}, headers=headers)
+
+    async def list_purchase_orders(client, headers, i):
+        return await client.get("/api/ordenes-compra", headers=headers)
+
+    async def assign_purchase_order(client, headers, i):
+        ids = assigned_ids(i)
+        numero_orden = f"BENCH-PO-{i:06d}"
+        assignments.append((numero_orden, ids))
+        return await client.post(
+            "/api/ordenes-compra/asignar",
+            json={"numero_orden": numero_orden, "equipment_ids": ids},
+            headers=headers,
+        )
+
+    async def manufacturer_response(client, headers, i):
+        numero_orden, ids = assignments[i % len(assignments)]
+        return await client.post(
+            f"/api/ordenes-compra/{numero_orden}/respuesta-fabricante",
+            json={
+                "equipment_ids": ids,
+                "numero_recepcion_fabricante": f"BENCH-RMA-{i}",
+                "en_garantia": i % 2 == 0,
+                "numero_presupuesto": None if i % 2 == 0 else f"BENCH-PRES-{i}",
+                "presupuesto_aceptado": None if i % 2 == 0 else True,
+            },
+            headers=headers,
+        )
+
+    async def receive_equipment(client, headers, i):
+        _, ids = assignments[i % len(assignments)]
+        return await client.post("/api/equipos/recibir", json={"equipment_ids": ids}, headers=headers)
+
+    async def export_csv(client, headers, i):
+        po_numbers = fixtures["po_numbers"]
+        return await client.get(f"/api/ordenes-compra/{po_numbers[i % len(po_numbers)]}/export-csv", headers=headers)
+
+    scenarios = [
+        ("POST /api/auth/login", login, total),
+        ("GET /api/equipos", list_equipment, total),
+        ("GET /api/equipos/pendientes", list_pending, total),
+        ("GET /api/equipos/para-recepcion", list_reception, total),
+        ("GET /api/clientes?view=compact", list_clients_compact, total),
+        ("GET /api/clientes/sugerir", suggest_clients, total),
+        ("GET /api/ordenes-compra", list_purchase_orders, total),
+    ]
+    # Each assignment consumes EQUIPMENT_PER_REQUEST distinct pending units
+    write_total = min(total, len(pending_ids) // EQUIPMENT_PER_REQUEST)
+    if write_total:
+        scenarios += [
+            ("POST /api/ordenes-compra/asignar", assign_purchase_order, write_total),
+            ("POST /api/ordenes-compra/{n}/respuesta-fabricante", manufacturer_response, write_total),
+            ("POST /api/equipos/recibir", receive_equipment, write_total),
+        ]
+    if fixtures["po_numbers"]:
+        scenarios.append(("GET /api/ordenes-compra/{n}/export-csv", export_csv, total))
+    return scenarios
+
+
+async def run_scenario(client, headers, make_request, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < total:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, headers, i)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+async def main(args):
+    equipment_count = SCALES[args.scale]
+    db_name = f"bench_{args.scale}"
+    await bind_database(args.backend, db_name)
+
+    import server
+    # One JSON access line per request would dominate the run
+    for name in ("access", "server", "database", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    async with server.app.router.lifespan_context(server.app):
+        db = database.db
+        if await db.equipment.estimated_document_count():
+            await db.client.drop_database(db_name)
+            await server.ensure_indexes()
+
+        seed_started = time.perf_counter()
+        fixtures = await seed(db, equipment_count, args.seed)
+        seed_seconds = time.perf_counter() - seed_started
+
+        transport = httpx.ASGITransport(app=server.app)
+        results = {}
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            login = await client.post("/api/auth/login", json={"username": USERNAME, "password": PASSWORD})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            for name, make_request, total in build_scenarios(fixtures, args.requests):
+                results[name] = await run_scenario(client, headers, make_request, total, args.concurrency)
+                if results[name]["errors"]:
+                    print(f"{name}: {results[name]['errors']}/{total} errores", file=sys.stderr)
+                else:
+                    print(f"{name}: p50={results[name]['p50_ms']}ms p95={results[name]['p95_ms']}ms", file=sys.stderr)
+
+        if args.backend == "mongod" and not args.keep:
+            await db.client.drop_database(db_name)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "backend": args.backend,
+            "scale": args.scale,
+            "equipment": equipment_count,
+            "seed": args.seed,
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "seed_seconds": round(seed_seconds, 2),
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+    print(output)
+    # Latencies of failed requests are meaningless: make the run fail
+    return 1 if any(result["errors"] for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga en proceso de las rutas principales")
+    parser.add_argument("--scale", choices=list(SCALES), default="1k")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por ruta")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--keep", action="store_true", help="no borrar la base de datos de benchmark")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,261 @@
+"""In-memory collaboration hub for the bulk workflow screens.
+
+Technicians working the same screen join a room: the purchase order number
+on "respuesta fabricante", or "recepcion" on the reception screen. Inside a
+room the hub:
+
+- hands out selection locks on equipment ids, so two people cannot select
+  and submit the same units at once
+- broadcasts lock changes, presence and equipment state changes
+- sends heartbeats and drops connections that stop answering
+
+Each connection has a bounded outbound queue drained by its own sender task.
+A connection whose queue fills up is closed rather than allowed to hold up
+the broadcast; on reconnect it receives a fresh snapshot. The hub lives in
+one process: with several uvicorn workers, sticky sessions are needed for
+everyone on a screen to share a room.
+"""
+import asyncio
+import itertools
+import logging
+import time
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_QUEUE_SIZE = 100
+HEARTBEAT_INTERVAL_SECONDS = 20
+HEARTBEAT_TIMEOUT_SECONDS = 60
+MAX_LOCKS_PER_MESSAGE = 1000
+CLOSE_TRY_AGAIN_LATER = 1013
+RECEPTION_ROOM = "recepcion"
+
+
+class Connection:
+    """One WebSocket (or any object with an async `send(bytes)`) in a room."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, room: str, username: str, send, close=None):
+        self.id = next(self._ids)
+        self.room = room
+        self.username = username
+        self._send = send
+        self._close = close
+        self.queue = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self.sender_task = None
+
+    def offer(self, payload: bytes) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def run_sender(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                if payload is None:
+                    break
+                await self._send(payload)
+        except Exception:
+            # The socket went away; the receive loop notices and cleans up
+            pass
+        finally:
+            self.closed = True
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self._close:
+            try:
+                await self._close(code)
+            except Exception:
+                pass
+
+
+class Room:
+    def __init__(self, name: str):
+        self.name = name
+        self.connections = {}
+        # equipment id -> Connection holding the lock
+        self.locks = {}
+
+    def users(self) -> list:
+        return sorted({connection.username for connection in self.connections.values()})
+
+    def lock_owners(self) -> dict:
+        return {equipment_id: owner.username for equipment_id, owner in self.locks.items()}
+
+
+class CollaborationHub:
+    def __init__(self):
+        self.rooms = {}
+        self._heartbeat_task = None
+
+    # Connection lifecycle
+
+    async def join(self, room_name: str, username: str, send, close=None) -> Connection:
+        room = self.rooms.setdefault(room_name, Room(room_name))
+        connection = Connection(room_name, username, send, close)
+        connection.sender_task = asyncio.create_task(connection.run_sender())
+        room.connections[connection.id] = connection
+        connection.offer(orjson.dumps({
+            "type": "snapshot",
+            "room": room_name,
+            "locks": room.lock_owners(),
+            "users": room.users(),
+        }))
+        self.broadcast(room_name, {"type": "presence", "users": room.users()})
+        return connection
+
+    async def leave(self, connection: Connection):
+        room = self.rooms.get(connection.room)
+        if room is None or room.connections.pop(connection.id, None) is None:
+            return
+        released = [equipment_id for equipment_id, owner in room.locks.items() if owner is connection]
+        for equipment_id in released:
+            del room.locks[equipment_id]
+        # Room bookkeeping happens before the await below, so concurrent leaves never race on it
+        if not room.connections:
+            del self.rooms[connection.room]
+        else:
+            if released:
+                self.broadcast(connection.room, {
+                    "type": "unlocked", "equipment_ids": released, "user": connection.username
+                })
+            self.broadcast(connection.room, {"type": "presence", "users": room.users()})
+        # Cancel rather than queue a stop sentinel: a connection the hub already closed
+        # (slow client, heartbeat timeout) no longer accepts one, and the socket is gone anyway
+        if connection.sender_task:
+            connection.sender_task.cancel()
+            await asyncio.gather(connection.sender_task, return_exceptions=True)
+
+    # Messages
+
+    def broadcast(self, room_name: str, message: dict, exclude: Connection = None):
+        room = self.rooms.get(room_name)
+        if room is None:
+            return 0
+        payload = orjson.dumps(message)
+        delivered = 0
+        for connection in list(room.connections.values()):
+            if connection is exclude or connection.closed:
+                # Closed ones are waiting for their receive loop to call leave()
+                continue
+            if connection.offer(payload):
+                delivered += 1
+            else:
+                # Too far behind to trust its view of the locks: make it reconnect
+                logger.info("Dropping slow collaboration client %s in %s", connection.username, room_name)
+                asyncio.create_task(connection.close(CLOSE_TRY_AGAIN_LATER))
+        return delivered
+
+    async def handle_message(self, connection: Connection, message: dict):
+        connection.last_seen = time.monotonic()
+        message_type = message.get("type")
+        equipment_ids = [str(equipment_id) for equipment_id in message.get("equipment_ids", [])][:MAX_LOCKS_PER_MESSAGE]
+        if message_type == "lock":
+            self.lock(connection, equipment_ids)
+        elif message_type == "unlock":
+            self.unlock(connection, equipment_ids)
+        elif message_type == "ping":
+            connection.offer(orjson.dumps({"type": "pong"}))
+        # "pong" and anything else only refresh last_seen
+
+    def lock(self, connection: Connection, equipment_ids: list):
+        room = self.rooms[connection.room]
+        granted = []
+        denied = {}
+        for equipment_id in equipment_ids:
+            owner = room.locks.get(equipment_id)
+            if owner is None or owner is connection:
+                room.locks[equipment_id] = connection
+                granted.append(equipment_id)
+            else:
+                denied[equipment_id] = owner.username
+        if granted:
+            self.broadcast(connection.room, {
+                "type": "locked", "equipment_ids": granted, "user": connection.username
+            })
+        if denied:
+            connection.offer(orjson.dumps({"type": "lock_denied", "held_by": denied}))
+
+    def unlock(self, connection: Connection, equipment_ids: list):
+        room = self.rooms[connection.room]
+        released = [
+            equipment_id for equipment_id in equipment_ids
+            if room.locks.get(equipment_id) is connection
+        ]
+        for equipment_id in released:
+            del room.locks[equipment_id]
+        if released:
+            self.broadcast(connection.room, {
+                "type": "unlocked", "equipment_ids": released, "user": connection.username
+            })
+
+    # Hooks for the HTTP routes
+
+    def locked_by_others(self, room_name: str, equipment_ids, username: str) -> dict:
+        """Ids in `equipment_ids` locked in the room by someone other than `username`."""
+        room = self.rooms.get(room_name)
+        if room is None:
+            return {}
+        return {
+            equipment_id: room.locks[equipment_id].username
+            for equipment_id in equipment_ids
+            if equipment_id in room.locks and room.locks[equipment_id].username != username
+        }
+
+    def equipment_changed(self, room_name: str, equipment_ids, changes: dict):
+        """Broadcast a state change and release the locks it settles."""
+        room = self.rooms.get(room_name)
+        if room is None:
+            return
+        equipment_ids = list(equipment_ids)
+        released = [equipment_id for equipment_id in equipment_ids if room.locks.pop(equipment_id, None)]
+        self.broadcast(room_name, {
+            "type": "equipment.updated",
+            "equipment_ids": equipment_ids,
+            "changes": {key: value for key, value in changes.items() if key != "updated_at"},
+        })
+        if released:
+            self.broadcast(room_name, {"type": "unlocked", "equipment_ids": released, "user": None})
+
+    # Heartbeats
+
+    def start(self):
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+
+    async def sweep(self, now: float = None):
+        """Ping every connection and close the ones silent for too long."""
+        now = now if now is not None else time.monotonic()
+        ping = orjson.dumps({"type": "ping"})
+        for room in list(self.rooms.values()):
+            for connection in list(room.connections.values()):
+                if now - connection.last_seen > HEARTBEAT_TIMEOUT_SECONDS:
+                    await connection.close(1001)
+                else:
+                    connection.offer(ping)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
+            await self.sweep()
+
+
+hub = CollaborationHub()
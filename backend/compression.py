@@ -0,0 +1,159 @@
+"""Negotiated gzip/Brotli response compression.
+
+Responses are compressed when the client accepts it, the body is at least
+COMPRESSION_MIN_SIZE bytes (default 1024) and the content type is textual
+(JSON, CSV, text). Brotli is preferred when the optional `brotli` package is
+installed; otherwise gzip is used. Levels come from GZIP_LEVEL (default 6)
+and BROTLI_QUALITY (default 4: much smaller than gzip on repetitive JSON at a
+similar CPU cost). Server-sent event streams are never compressed, so each
+event reaches the browser as soon as it is written.
+"""
+import gzip
+import io
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/x-ndjson", b"application/javascript")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Map each accepted coding to its q-value."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header: str):
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = None
+    best_quality = 0.0
+    for coding in candidates:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._buffer = io.BytesIO()
+            self._gzip = gzip.GzipFile(mode="wb", fileobj=self._buffer, compresslevel=gzip_level)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        self._gzip.write(data)
+        self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        return self._drain()
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        self._gzip.close()
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    compressor = _Compressor(encoding, gzip_level, brotli_quality)
+    return compressor.compress(data) + compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=None, gzip_level=None, brotli_quality=None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else _env_int("COMPRESSION_MIN_SIZE", 1024)
+        self.gzip_level = gzip_level if gzip_level is not None else _env_int("GZIP_LEVEL", 6)
+        self.brotli_quality = brotli_quality if brotli_quality is not None else _env_int("BROTLI_QUALITY", 4)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = choose_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = dict(start_message.get("headers", []))
+                content_type = headers.get(b"content-type", b"")
+                too_small = not more_body and len(body) < self.minimum_size
+                if (too_small or b"content-encoding" in headers
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or content_type.startswith(b"text/event-stream")):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                response_headers = [
+                    (name, value) for name, value in start_message.get("headers", [])
+                    if name != b"content-length"
+                ]
+                response_headers.append((b"content-encoding", encoding.encode()))
+                response_headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    compressed = compressor.compress(body) + compressor.finish()
+                    response_headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start_message, "headers": response_headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start_message, "headers": response_headers})
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,123 @@
+"""MongoDB connection lifecycle.
+
+The Motor client is created inside the running event loop (from the app
+lifespan or a CLI's `asyncio.run`) instead of at import time, so every
+uvicorn worker gets its own pool bound to its own loop. Pool size, timeouts
+and wire compression come from the environment:
+
+    MONGO_MAX_POOL_SIZE                connections per worker (default 50)
+    MONGO_MIN_POOL_SIZE                connections kept open (default 5)
+    MONGO_MAX_IDLE_TIME_MS             idle connection lifetime (default 300000)
+    MONGO_CONNECT_TIMEOUT_MS           TCP connect timeout (default 5000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  replica selection timeout (default 5000)
+    MONGO_SOCKET_TIMEOUT_MS            per-operation socket timeout (default 30000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS        wait for a free pooled connection (default 10000)
+    MONGO_COMPRESSORS                  e.g. "zstd,snappy,zlib" (default: none)
+
+With several uvicorn workers the server sees workers * MONGO_MAX_POOL_SIZE
+connections at most, so size the pool per worker accordingly.
+"""
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def client_options() -> dict:
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 5),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000),
+    }
+    compressors = os.environ.get("MONGO_COMPRESSORS", "").strip()
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+class DatabaseProxy:
+    """Stands in for the Motor database until `connect()` has run.
+
+    Route handlers keep using `db.equipment`, `db["clients"]`, etc.; the
+    attribute access is forwarded to the database bound at startup.
+    """
+
+    def __init__(self):
+        self._target = None
+
+    def bind(self, target):
+        self._target = target
+
+    @property
+    def is_bound(self) -> bool:
+        return self._target is not None
+
+    def _require(self):
+        if self._target is None:
+            raise RuntimeError("La base de datos no está inicializada")
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._require(), name)
+
+    def __getitem__(self, name):
+        return self._require()[name]
+
+
+db = DatabaseProxy()
+client = None
+
+
+async def connect(**extra_options):
+    """Create the Motor client on the running loop and bind `db` to it."""
+    global client
+    if client is None:
+        options = {**client_options(), **extra_options}
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'], **options)
+        db.bind(client[os.environ['DB_NAME']])
+    return db
+
+
+async def ping() -> float:
+    """Round-trip a ping and return its latency in milliseconds."""
+    if client is None:
+        raise RuntimeError("La base de datos no está inicializada")
+    started = time.perf_counter()
+    await client.admin.command("ping")
+    return (time.perf_counter() - started) * 1000
+
+
+async def warmup():
+    """Open the minimum pool up front so the first requests don't pay for it."""
+    connections = max(1, client_options()["minPoolSize"])
+    started = time.perf_counter()
+    await asyncio.gather(*[client.admin.command("ping") for _ in range(connections)])
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info("MongoDB warm: %d connections in %.1f ms", connections, elapsed_ms)
+    return elapsed_ms
+
+
+def close():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+        db.bind(None)
@@ -0,0 +1,149 @@
+"""Live change events for equipment, fanned out to connected browsers.
+
+Events are compact diffs: the ids that changed and the fields that were
+set, e.g. ``{"type": "equipment.updated", "ids": [...], "changes": {...}}``.
+
+They come from one of two sources, picked at startup:
+
+- a MongoDB change stream on `equipment` when the server supports it
+  (replica set or sharded cluster), which also sees writes made by other
+  uvicorn workers and scripts
+- otherwise an in-process bus fed by the route handlers via `emit()`;
+  with several workers each one only sees its own writes
+
+Every subscriber gets a bounded queue. A subscriber that falls behind is not
+allowed to slow down the others: its queue is cleared and it receives a
+single ``resync`` event telling the client to reload its lists.
+"""
+import asyncio
+import itertools
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 256
+# Fields that only change as a side effect and are not worth pushing
+IGNORED_FIELDS = {"updated_at"}
+
+
+def make_event(event_type: str, ids, changes=None) -> dict:
+    return {
+        "type": event_type,
+        "ids": list(ids),
+        "changes": {
+            key: value for key, value in (changes or {}).items() if key not in IGNORED_FIELDS
+        },
+        "ts": datetime.utcnow().isoformat(),
+    }
+
+
+class Subscription:
+    def __init__(self, bus: "EventBus"):
+        self.bus = bus
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: drop its backlog and tell it to reload instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({**make_event("resync", []), "id": event["id"]})
+
+    async def get(self, timeout: float):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self):
+        self.subscribers = set()
+        self.source = "local"
+        self._ids = itertools.count(1)
+        self._watch_task = None
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, event: dict):
+        event = {**event, "id": next(self._ids)}
+        for subscription in list(self.subscribers):
+            subscription.offer(event)
+
+    def emit(self, event_type: str, ids, changes=None):
+        """Called by route handlers after a write; a no-op when a change stream is the source."""
+        if self.source == "local" and self.subscribers:
+            self.publish(make_event(event_type, ids, changes))
+
+    async def start(self, db):
+        if await supports_change_streams(db):
+            self.source = "change_stream"
+            self._watch_task = asyncio.create_task(self._watch(db))
+        logger.info("Event source: %s", self.source)
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def _watch(self, db):
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+            {"$project": {
+                "operationType": 1,
+                "updateDescription.updatedFields": 1,
+                "fullDocument.id": 1,
+            }},
+        ]
+        resume_token = None
+        while True:
+            try:
+                async with db.equipment.watch(
+                    pipeline, full_document="updateLookup", resume_after=resume_token
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._publish_change(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Equipment change stream failed; retrying")
+                await asyncio.sleep(1)
+
+    def _publish_change(self, change: dict):
+        equipment_id = (change.get("fullDocument") or {}).get("id")
+        if not equipment_id or not self.subscribers:
+            return
+        if change["operationType"] == "insert":
+            self.publish(make_event("equipment.created", [equipment_id]))
+        else:
+            changes = (change.get("updateDescription") or {}).get("updatedFields", {})
+            if changes.get("deleted_at") is not None:
+                # A soft delete is an update in the change stream; publish it as the route does
+                self.publish(make_event("equipment.deleted", [equipment_id]))
+            else:
+                self.publish(make_event("equipment.updated", [equipment_id], changes))
+
+
+async def supports_change_streams(db) -> bool:
+    try:
+        hello = await db.command("hello")
+    except Exception:
+        return False
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+
+bus = EventBus()
@@ -0,0 +1,213 @@
+"""Lightweight in-process background jobs.
+
+Heavy work (exports, imports, analytics) is submitted as a job instead of
+running in the request handler: the route returns 202 with the job, a pool
+of JOB_CONCURRENCY worker tasks (default 2) runs queued jobs one at a time
+each, and the client polls GET /api/trabajos/{id} until it can download the
+result from GET /api/trabajos/{id}/resultado.
+
+Job status lives in the `jobs` collection and results in `job_results`, so
+any worker can answer status, cancel and download requests; both expire
+after JOB_RETENTION_HOURS (default 24) through TTL indexes. The queue itself
+is in-process: jobs still queued or running when a worker shuts down are
+marked "interrumpido" and have to be submitted again.
+
+Handlers are registered by kind and receive a JobContext plus the job's
+parameters; they return a JobResult, or None when there is nothing to
+download. Long handlers call `check_cancelled()` between batches, which
+raises JobCancelled once someone has asked to cancel the job:
+
+    @jobs.queue.handler("exportar-csv")
+    async def export_csv(context, numero_orden):
+        await context.report(procesados=10)
+        await context.check_cancelled()
+        return jobs.JobResult(content, "orden.csv", "text/csv")
+
+Jobs submitted with the same `exclusive` key never run at the same time,
+across all workers: a unique index on the key only admits one unfinished
+job per key.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import NamedTuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_HOURS", "24")) * 3600
+MAX_RESULT_BYTES = 15 * 1024 * 1024  # stays under MongoDB's 16 MB document limit
+UNFINISHED_STATES = ("pendiente", "en_curso")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobResult(NamedTuple):
+    content: bytes
+    filename: str
+    media_type: str
+
+
+class JobContext:
+    def __init__(self, db, job_id: str):
+        self.db = db
+        self.job_id = job_id
+
+    async def report(self, **progress):
+        await self.db.jobs.update_one(
+            {"id": self.job_id},
+            {"$set": {**{f"progreso.{key}": value for key, value in progress.items()},
+                      "updated_at": datetime.utcnow()}}
+        )
+
+    async def check_cancelled(self):
+        job = await self.db.jobs.find_one({"id": self.job_id}, {"_id": 0, "cancelar": 1})
+        if job and job.get("cancelar"):
+            raise JobCancelled()
+
+
+class JobQueue:
+    def __init__(self, concurrency: int = None):
+        self.concurrency = concurrency or int(os.environ.get("JOB_CONCURRENCY", "2"))
+        self.handlers = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._db = None
+        self._queue = None
+        self._workers = []
+
+    def handler(self, kind: str):
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    def start(self, db):
+        self._db = db
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._db is not None:
+            await self._db.jobs.update_many(
+                {"worker": self.worker_id, "estado": {"$in": list(UNFINISHED_STATES)}},
+                {"$set": {"estado": "interrumpido", "finished_at": datetime.utcnow()}, "$unset": {"exclusivo": ""}}
+            )
+
+    async def submit(self, kind: str, params: dict, username: str, exclusive: str = None) -> dict:
+        """Queue a job; raise RuntimeError if an unfinished job holds the same `exclusive` key."""
+        if kind not in self.handlers:
+            raise KeyError(kind)
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "tipo": kind,
+            "parametros": params,
+            "usuario": username,
+            "estado": "pendiente",
+            "progreso": {},
+            "resultado": None,
+            "error": None,
+            "cancelar": False,
+            "worker": self.worker_id,
+            "created_at": now,
+            "updated_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        if exclusive:
+            job["exclusivo"] = exclusive
+        try:
+            await self._db.jobs.insert_one(dict(job))
+        except DuplicateKeyError:
+            raise RuntimeError(f"Ya hay un trabajo {exclusive} en curso")
+        self._queue.put_nowait(job["id"])
+        return job
+
+    async def cancel(self, job_id: str):
+        """Flag the job for cancellation; its handler stops at the next check_cancelled()."""
+        await self._db.jobs.update_one(
+            {"id": job_id, "estado": {"$in": list(UNFINISHED_STATES)}},
+            {"$set": {"cancelar": True, "updated_at": datetime.utcnow()}}
+        )
+        return await self.get(job_id)
+
+    async def get(self, job_id: str):
+        return await self._db.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def get_result(self, job_id: str):
+        return await self._db.job_results.find_one({"job_id": job_id}, {"_id": 0})
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # e.g. Mongo unreachable while reading or updating the job: keep the worker alive
+                logger.exception("Job %s could not be run", job_id)
+                await self._fail(job_id, exc)
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        if job is None:
+            return
+        if job.get("cancelar"):
+            await self._finish(job_id, estado="cancelado")
+            return
+        await self._set(job_id, estado="en_curso", started_at=datetime.utcnow())
+        try:
+            result = await self.handlers[job["tipo"]](JobContext(self._db, job_id), **job["parametros"])
+            if result is None:
+                await self._finish(job_id, estado="completado")
+                return
+            if len(result.content) > MAX_RESULT_BYTES:
+                raise ValueError("El resultado supera el tamaño máximo permitido")
+            await self._db.job_results.insert_one({
+                "job_id": job_id, "content": result.content, "created_at": datetime.utcnow()
+            })
+            await self._finish(job_id, estado="completado", resultado={
+                "filename": result.filename,
+                "media_type": result.media_type,
+                "size": len(result.content),
+            })
+        except JobCancelled:
+            await self._finish(job_id, estado="cancelado")
+        except asyncio.CancelledError:
+            # Worker shutting down; stop() marks the job as interrupted
+            raise
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed", job_id, job["tipo"])
+            await self._fail(job_id, exc)
+
+    async def _fail(self, job_id: str, exc: Exception):
+        # Best effort: if the database is what failed, the job stays as it was
+        try:
+            await self._finish(job_id, estado="error", error=str(exc))
+        except Exception:
+            logger.exception("Could not mark job %s as failed", job_id)
+
+    async def _set(self, job_id: str, **fields):
+        await self._db.jobs.update_one({"id": job_id}, {"$set": {**fields, "updated_at": datetime.utcnow()}})
+
+    async def _finish(self, job_id: str, **fields):
+        # Dropping the exclusive key lets another job with the same key be submitted
+        now = datetime.utcnow()
+        await self._db.jobs.update_one(
+            {"id": job_id},
+            {"$set": {**fields, "finished_at": now, "updated_at": now}, "$unset": {"exclusivo": ""}}
+        )
+
+
+queue = JobQueue()
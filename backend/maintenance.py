@@ -0,0 +1,269 @@
+"""Admin maintenance operations, run as cancellable background jobs.
+
+Each operation works in bounded batches, reports progress on its job and
+can be cancelled between batches. They run on the shared background job
+queue (jobs.py), so status and cancellation work from any worker, and at
+most one maintenance job is unfinished at a time across all of them:
+
+- reiniciar-datos: delete documents from the operational collections
+  (equipment, purchase orders, clients, archive) created since a given
+  date, e.g. a test session; the date is required, so a run can never wipe
+  the whole collections
+- compactar: run `compact` on each collection
+- reconstruir-indices: recreate the indexes of each collection one at a
+  time, building a stand-in first so queries never lose the index, then
+  recreate any index the app expects but is missing. Unique indexes are
+  left alone: without them duplicates could be written meanwhile and the
+  rebuild fail
+- recalcular-derivados: recompute derived data: client search keys, the
+  client/work-center names copied onto equipment and each purchase order's
+  equipment list
+
+The API exposes them under /api/admin/mantenimiento.
+
+Usage (from the backend directory):
+    python maintenance.py reiniciar-datos --since 2026-01-01
+        [--collections equipment clients] [--batch-size 1000]
+    python maintenance.py compactar|reconstruir-indices|recalcular-derivados
+"""
+import argparse
+import asyncio
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+import database
+import jobs
+
+RESETTABLE_COLLECTIONS = ("equipment", "purchase_orders", "clients", "equipment_archive")
+REFERENCE_COLLECTIONS = ("manufacturers", "models", "fault_types")
+EXCLUSIVE_KEY = "mantenimiento"
+
+
+class ConsoleContext:
+    """Stand-in for jobs.JobContext when an operation runs from the command line."""
+
+    def __init__(self, db):
+        self.db = db
+        self.progreso = {}
+
+    async def report(self, **progress):
+        self.progreso.update(progress)
+
+    async def check_cancelled(self):
+        # Ctrl-C cancels the task instead
+        pass
+
+
+def _check_collections(collections, allowed) -> list:
+    unknown = [name for name in collections if name not in allowed]
+    if unknown:
+        raise ValueError(f"Colecciones no permitidas: {', '.join(unknown)}")
+    return list(collections)
+
+
+# Operations
+
+async def reset_data(database, context, colecciones=None, creados_desde=None, batch_size: int = 1000):
+    collections = _check_collections(
+        colecciones or RESETTABLE_COLLECTIONS, RESETTABLE_COLLECTIONS + REFERENCE_COLLECTIONS
+    )
+    if not creados_desde:
+        raise ValueError("reiniciar-datos requiere creados_desde")
+    query = {"created_at": {"$gte": creados_desde}}
+    total = 0
+    for name in collections:
+        total += await database[name].count_documents(query)
+    await context.report(total=total, procesados=0)
+
+    processed = 0
+    for name in collections:
+        await context.report(coleccion=name)
+        while True:
+            batch = await database[name].find(query, {"_id": 1}).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            result = await database[name].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+            processed += result.deleted_count
+            await context.report(procesados=processed)
+            await context.check_cancelled()
+
+
+async def compact(database, context, colecciones=None, batch_size: int = None):
+    collections = colecciones or sorted(await database.list_collection_names())
+    errors = {}
+    await context.report(total=len(collections), procesados=0, errores=errors)
+    for index, name in enumerate(collections, 1):
+        await context.report(coleccion=name)
+        try:
+            await database.command("compact", name)
+        except OperationFailure as exc:
+            # e.g. missing privileges or a collection dropped meanwhile; keep going
+            errors[name] = str(exc)
+        await context.report(procesados=index, errores=errors)
+        await context.check_cancelled()
+
+
+async def rebuild_indexes(database, context, colecciones=None, batch_size: int = None):
+    import server  # server imports this module
+
+    collections = colecciones or sorted(await database.list_collection_names())
+    await context.report(total=len(collections), procesados=0, indices=0, omitidos=0)
+    rebuilt = skipped = 0
+    for index, name in enumerate(collections, 1):
+        await context.report(coleccion=name)
+        collection = database[name]
+        for index_name, spec in (await collection.index_information()).items():
+            if index_name == "_id_":
+                continue
+            if spec.get("unique") or any(field == "_id" for field, _ in spec["key"]):
+                skipped += 1
+                await context.report(omitidos=skipped)
+                continue
+            options = {key: value for key, value in spec.items() if key not in ("key", "v", "ns")}
+            # Queries keep an index while the original is rebuilt: MongoDB refuses a second index
+            # with the same key, so the stand-in appends _id, which still serves the same prefix
+            stand_in = f"{index_name}_rebuild"
+            await collection.create_index(
+                spec["key"] + [("_id", 1)], name=stand_in,
+                **{key: value for key, value in options.items() if key != "expireAfterSeconds"}
+            )
+            await collection.drop_index(index_name)
+            await collection.create_index(spec["key"], name=index_name, **options)
+            await collection.drop_index(stand_in)
+            rebuilt += 1
+            await context.report(indices=rebuilt)
+            await context.check_cancelled()
+        await context.report(procesados=index)
+    await context.report(coleccion=None)
+    await server.ensure_indexes()
+
+
+async def rebuild_derived(database, context, colecciones=None, batch_size: int = 1000):
+    import server  # server imports this module
+
+    await context.report(fase="claves_busqueda")
+    await server.backfill_client_search_keys(batch_size=batch_size, query={})
+
+    await context.report(fase="nombres_equipos", total=await database.clients.count_documents(server.NOT_DELETED), procesados=0)
+    processed = 0
+    cursor = database.clients.find(server.NOT_DELETED, {"_id": 0, "id": 1, "nombre": 1, "centros_trabajo": 1})
+    async for client in cursor.batch_size(batch_size):
+        renames = [({"cliente_id": client["id"]}, "cliente_nombre", client.get("nombre"))]
+        renames += [
+            ({"cliente_id": client["id"], "centro_trabajo_id": wc.get("id")}, "centro_trabajo_nombre", wc.get("nombre"))
+            for wc in client.get("centros_trabajo") or []
+        ]
+        for match, field, value in renames:
+            await database.equipment.update_many(
+                {**match, **server.NOT_DELETED, field: {"$ne": value}},
+                {"$set": {field: value}, "$inc": {"version": 1}}
+            )
+        processed += 1
+        if processed % batch_size == 0:
+            await context.report(procesados=processed)
+            await context.check_cancelled()
+    await context.report(procesados=processed)
+
+    await context.report(fase="ordenes_compra")
+    pending = []
+    pipeline = [
+        {"$match": {**server.NOT_DELETED, "numero_orden_compra": {"$ne": None}}},
+        {"$group": {"_id": "$numero_orden_compra", "equipments": {"$push": "$id"}}},
+    ]
+    async for order in database.equipment.aggregate(pipeline):
+        pending.append(UpdateOne({"numero_orden": order["_id"]}, {"$set": {"equipments": order["equipments"]}}))
+        if len(pending) >= batch_size:
+            await database.purchase_orders.bulk_write(pending, ordered=False)
+            pending = []
+            await context.check_cancelled()
+    if pending:
+        await database.purchase_orders.bulk_write(pending, ordered=False)
+
+
+OPERATIONS = {
+    "reiniciar-datos": reset_data,
+    "compactar": compact,
+    "reconstruir-indices": rebuild_indexes,
+    "recalcular-derivados": rebuild_derived,
+}
+
+
+def validate_params(operation: str, params: dict):
+    """Raise KeyError for an unknown operation and ValueError for bad parameters."""
+    if operation not in OPERATIONS:
+        raise KeyError(operation)
+    if params.get("creados_desde") and operation != "reiniciar-datos":
+        raise ValueError("creados_desde solo se admite en reiniciar-datos")
+    if operation == "reiniciar-datos" and not params.get("creados_desde"):
+        # Without a date the batches would delete every document in the collections
+        raise ValueError("reiniciar-datos requiere creados_desde")
+    if params.get("colecciones"):
+        if operation == "recalcular-derivados":
+            raise ValueError("recalcular-derivados no admite colecciones")
+        if operation == "reiniciar-datos":
+            _check_collections(params["colecciones"], RESETTABLE_COLLECTIONS + REFERENCE_COLLECTIONS)
+
+
+def _job_handler(operation):
+    async def run(context: jobs.JobContext, **params):
+        await operation(context.db, context, **params)
+    return run
+
+
+for _name, _operation in OPERATIONS.items():
+    jobs.queue.handler(_name)(_job_handler(_operation))
+
+
+async def submit(operation: str, params: dict, username: str) -> dict:
+    """Queue a maintenance job; KeyError/ValueError for bad input, RuntimeError if one is unfinished."""
+    validate_params(operation, params)
+    try:
+        return await jobs.queue.submit(operation, params, username, exclusive=EXCLUSIVE_KEY)
+    except RuntimeError:
+        raise RuntimeError("Ya hay una operación de mantenimiento en curso")
+
+
+async def main(args):
+    db = await database.connect()
+    params = {"batch_size": args.batch_size}
+    if args.collections:
+        params["colecciones"] = args.collections
+    if args.since:
+        params["creados_desde"] = args.since
+    context = ConsoleContext(db)
+    task = asyncio.create_task(OPERATIONS[args.operation](db, context, **params))
+    estado = "completado"
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=2)
+            print(f"{args.operation}: {context.progreso}")
+        task.result()
+    except asyncio.CancelledError:
+        # Ctrl-C
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        estado = "cancelado"
+    except Exception as exc:
+        estado = f"error ({exc})"
+    finally:
+        database.close()
+    print(f"{args.operation}: {estado}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Operaciones de mantenimiento de la base de datos")
+    parser.add_argument("operation", choices=list(OPERATIONS))
+    parser.add_argument("--collections", nargs="+", help="colecciones afectadas (por defecto, según la operación)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="reiniciar-datos (obligatorio): solo documentos creados desde esta fecha")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    try:
+        validate_params(args.operation, {"colecciones": args.collections, "creados_desde": args.since})
+    except ValueError as exc:
+        parser.error(str(exc))
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
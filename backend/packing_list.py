@@ -0,0 +1,176 @@
+"""Purchase-order exports: CSV, XLSX spreadsheet and PDF packing list.
+
+All three formats share COLUMNS. XLSX and PDF rendering is CPU-bound, so
+it runs in a small process pool (EXPORT_PROCESSES, default 2) instead of on
+the event loop. Rendered files are cached in `export_cache`, keyed by a
+hash of the format and the purchase order's rows: the same content is never
+rendered twice, and any change to the equipment gives a new key (the old
+entries expire through a TTL index).
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import orjson
+
+# Bump when the rendered layout changes so cached files are not reused
+RENDER_VERSION = 3
+CACHE_TTL_SECONDS = 7 * 86400
+
+COLUMNS = [
+    ("Orden de Trabajo", lambda eq: eq.get("orden_trabajo")),
+    ("Cliente", lambda eq: eq.get("cliente_nombre")),
+    ("Centro de Trabajo", lambda eq: eq.get("centro_trabajo_nombre")),
+    ("Tipo de Equipo", lambda eq: eq.get("tipo_equipo")),
+    ("Modelo", lambda eq: eq.get("modelo")),
+    ("Fabricante", lambda eq: eq.get("fabricante")),
+    ("Numero de Serie", lambda eq: eq.get("numero_serie")),
+    ("Estado", lambda eq: eq.get("estado")),
+    ("Fecha Creacion", lambda eq: eq["created_at"].strftime("%Y-%m-%d") if eq.get("created_at") else None),
+]
+HEADER = [title for title, _ in COLUMNS]
+
+FORMATS = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+
+# Spreadsheets treat a cell starting with one of these as a formula (CSV injection)
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def safe_cell(value) -> str:
+    value = "" if value is None else str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def equipment_row(eq: dict) -> list:
+    # Every export builds its rows here, so user input never reaches a spreadsheet as a formula
+    return [safe_cell(get(eq)) for _, get in COLUMNS]
+
+
+def equipment_rows(equipment) -> list:
+    return [equipment_row(eq) for eq in equipment]
+
+
+def render_csv(rows: list) -> str:
+    # csv quotes fields containing commas, quotes or newlines
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def content_hash(fmt: str, order_number: str, rows: list) -> str:
+    payload = orjson.dumps([RENDER_VERSION, fmt, order_number, rows])
+    return hashlib.sha256(payload).hexdigest()
+
+
+# Renderers run in worker processes: plain data in, bytes out
+
+def render_xlsx(order_number: str, rows: list) -> bytes:
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Equipos"
+    sheet.append(HEADER)
+    for cell in sheet[1]:
+        cell.font = Font(bold=True)
+    for row in rows:
+        sheet.append(row)
+        # Values are user input: a leading "=" must stay text, not become a formula
+        for cell in sheet[sheet.max_row]:
+            cell.data_type = "s"
+    sheet.freeze_panes = "A2"
+    sheet.auto_filter.ref = sheet.dimensions
+    for index, title in enumerate(HEADER):
+        width = max([len(title)] + [len(row[index]) for row in rows])
+        sheet.column_dimensions[sheet.cell(row=1, column=index + 1).column_letter].width = min(width + 2, 50)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def render_pdf(order_number: str, rows: list) -> bytes:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    cell_style = styles["BodyText"].clone("cell", fontSize=7, leading=8.5)
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(
+        buffer, pagesize=landscape(A4), title=f"Packing list {order_number}",
+        leftMargin=10 * mm, rightMargin=10 * mm, topMargin=12 * mm, bottomMargin=12 * mm,
+    )
+    header = ["#"] + HEADER
+    # Paragraphs wrap long client/work-center names instead of overflowing the cell
+    body = [
+        [str(number)] + [Paragraph(value.replace("&", "&amp;").replace("<", "&lt;"), cell_style) for value in row]
+        for number, row in enumerate(rows, 1)
+    ]
+    table = Table([header] + body, repeatRows=1, colWidths=[8 * mm] + [None] * len(HEADER))
+    table.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ]))
+    document.build([
+        Paragraph(f"Packing list - Orden de compra {order_number}", styles["Title"]),
+        Paragraph(f"Total: {len(rows)} equipos", styles["Normal"]),
+        Spacer(1, 4 * mm),
+        table,
+    ])
+    return buffer.getvalue()
+
+
+RENDERERS = {"xlsx": render_xlsx, "pdf": render_pdf}
+
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Forking the server would copy Motor's monitor threads and the event loop mid-state
+        _pool = ProcessPoolExecutor(
+            max_workers=int(os.environ.get("EXPORT_PROCESSES", "2")),
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def render_cached(db, fmt: str, order_number: str, rows: list) -> bytes:
+    """Return the rendered file, rendering in the process pool on a cache miss."""
+    key = content_hash(fmt, order_number, rows)
+    cached = await db.export_cache.find_one({"hash": key}, {"_id": 0, "content": 1})
+    if cached:
+        return cached["content"]
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(_get_pool(), RENDERERS[fmt], order_number, rows)
+    await db.export_cache.update_one(
+        {"hash": key},
+        {"$setOnInsert": {"hash": key, "content": content, "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return content
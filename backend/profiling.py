@@ -0,0 +1,156 @@
+"""On-demand request profiling, enabled per request with `X-Profile: 1`.
+
+The request runs under cProfile and the collected stats are folded into
+three phases:
+
+- db_wait: time the event loop sat idle in the selector, i.e. waiting on
+  Mongo (Motor completes its operations on driver threads)
+- validation: Pydantic model construction and FastAPI response validation
+- serialization: jsonable_encoder plus response rendering
+
+The breakdown is sent back in a `Server-Timing` header and the full profile
+is kept in memory, retrievable by the id in `X-Profile-Id`. cProfile covers
+the whole event-loop thread, so requests running concurrently with a
+profiled one show up in it too; only one request is profiled at a time.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+PROFILE_HEADER = b"x-profile"
+MAX_STORED_PROFILES = 50
+TOP_FUNCTIONS = 40
+
+# (filename suffix, function name) pairs whose cumulative time makes up each phase
+PHASE_FUNCTIONS = {
+    "validation": [
+        ("pydantic/main.py", "__init__"),
+        ("fastapi/_compat.py", "validate"),
+    ],
+    "serialization": [
+        ("fastapi/encoders.py", "jsonable_encoder"),
+        ("starlette/responses.py", "render"),
+        ("fastapi/responses.py", "render"),
+    ],
+}
+SELECTOR_CALLS = ("select.epoll", "select.poll", "select.select", "select.kqueue")
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+_active = threading.Lock()
+
+
+def _matches(key, targets) -> bool:
+    filename, _, funcname = key
+    return any(filename.endswith(suffix) and funcname == name for suffix, name in targets)
+
+
+def summarize(stats: pstats.Stats, total_s: float) -> dict:
+    phases = {"db_wait": 0.0, "validation": 0.0, "serialization": 0.0}
+    for key, (_, _, _, cumulative, _) in stats.stats.items():
+        if key[0] == "~" and any(call in key[2] for call in SELECTOR_CALLS):
+            phases["db_wait"] += cumulative
+            continue
+        for phase, targets in PHASE_FUNCTIONS.items():
+            if _matches(key, targets):
+                phases[phase] += cumulative
+    phases = {phase: round(seconds * 1000, 3) for phase, seconds in phases.items()}
+    phases["other"] = round(max(0.0, total_s * 1000 - sum(phases.values())), 3)
+    return phases
+
+
+def _top_functions(stats: pstats.Stats) -> str:
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    return buffer.getvalue()
+
+
+def _store(profile: dict):
+    with _profiles_lock:
+        _profiles[profile["id"]] = profile
+        while len(_profiles) > MAX_STORED_PROFILES:
+            _profiles.popitem(last=False)
+
+
+def list_profiles() -> list:
+    with _profiles_lock:
+        return [
+            {key: value for key, value in profile.items() if key != "top_functions"}
+            for profile in reversed(_profiles.values())
+        ]
+
+
+def get_profile(profile_id: str):
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+class ProfileMiddleware:
+    """Profiles requests carrying `X-Profile: 1` when `authorize(headers)` allows it."""
+
+    def __init__(self, app, authorize):
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER) != b"1" or not self.authorize(headers):
+            await self.app(scope, receive, send)
+            return
+        if not _active.acquire(blocking=False):
+            # Another request is being profiled; serve this one normally
+            await self.app(scope, receive, send)
+            return
+
+        # Hold the response until the profile is done so its headers can carry the result
+        messages = []
+
+        async def buffer_send(message):
+            messages.append(message)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, buffer_send)
+            finally:
+                profiler.disable()
+        finally:
+            _active.release()
+        total_s = time.perf_counter() - started
+
+        stats = pstats.Stats(profiler)
+        phases = summarize(stats, total_s)
+        profile = {
+            "id": str(uuid.uuid4()),
+            "method": scope["method"],
+            "path": scope["path"],
+            "created_at": datetime.utcnow().isoformat(),
+            "total_ms": round(total_s * 1000, 3),
+            "phases": phases,
+            "top_functions": _top_functions(stats),
+        }
+        _store(profile)
+
+        server_timing = ", ".join(f"{phase};dur={ms}" for phase, ms in phases.items())
+        server_timing += f", total;dur={profile['total_ms']}"
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing.encode()),
+                        (b"x-profile-id", profile["id"].encode()),
+                    ],
+                }
+            await send(message)
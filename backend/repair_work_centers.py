@@ -0,0 +1,99 @@
+"""One-off repair job for malformed work centers stored in `clients`.
+
+Work centers are validated on write now, but documents written before that
+may still contain entries with an empty `id` or `nombre`, which the read
+routes would reject. The server runs this once at startup (see
+run_migration in server.py); it scans the collection with a cursor and
+rewrites only the affected clients in batches:
+
+- entries without a usable `nombre` are removed
+- entries with a usable `nombre` but no `id` get a fresh UUID
+- surrounding whitespace in `id`/`nombre` is trimmed
+
+Usage (from the backend directory):
+    python repair_work_centers.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import uuid
+
+from pymongo import UpdateOne
+
+import database
+
+
+def _clean_text(value) -> str:
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def clean_work_centers(work_centers):
+    """Return (cleaned_list, fixed_count, removed_count) for a client's work centers."""
+    cleaned = []
+    fixed = 0
+    removed = 0
+    for wc in work_centers or []:
+        if not isinstance(wc, dict):
+            removed += 1
+            continue
+        nombre = _clean_text(wc.get("nombre"))
+        if not nombre:
+            removed += 1
+            continue
+        wc_id = _clean_text(wc.get("id"))
+        if not wc_id:
+            wc_id = str(uuid.uuid4())
+        if wc_id != wc.get("id") or nombre != wc.get("nombre"):
+            fixed += 1
+        cleaned.append({**wc, "id": wc_id, "nombre": nombre})
+    return cleaned, fixed, removed
+
+
+async def repair_work_centers(database, batch_size: int = 500, dry_run: bool = False) -> dict:
+    stats = {"scanned": 0, "clients_updated": 0, "work_centers_fixed": 0, "work_centers_removed": 0}
+    pending = []
+
+    async def flush():
+        if pending and not dry_run:
+            await database.clients.bulk_write(pending, ordered=False)
+        pending.clear()
+
+    cursor = database.clients.find({}, {"_id": 0, "id": 1, "centros_trabajo": 1}).batch_size(batch_size)
+    async for client in cursor:
+        stats["scanned"] += 1
+        cleaned, fixed, removed = clean_work_centers(client.get("centros_trabajo"))
+        if not fixed and not removed:
+            continue
+        stats["clients_updated"] += 1
+        stats["work_centers_fixed"] += fixed
+        stats["work_centers_removed"] += removed
+        pending.append(UpdateOne(
+            {"id": client["id"]},
+            {"$set": {"centros_trabajo": cleaned}, "$inc": {"version": 1}}
+        ))
+        if len(pending) >= batch_size:
+            await flush()
+    await flush()
+    return stats
+
+
+async def main(batch_size: int, dry_run: bool):
+    db = await database.connect()
+    try:
+        stats = await repair_work_centers(db, batch_size, dry_run)
+    finally:
+        database.close()
+    prefix = "[dry-run] " if dry_run else ""
+    print(f"{prefix}Clientes revisados: {stats['scanned']}")
+    print(f"{prefix}Clientes corregidos: {stats['clients_updated']}")
+    print(f"{prefix}Centros de trabajo corregidos: {stats['work_centers_fixed']}")
+    print(f"{prefix}Centros de trabajo eliminados: {stats['work_centers_removed']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repara centros de trabajo con id/nombre vacíos")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run))
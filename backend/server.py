@@ -1,25 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, BackgroundTasks, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
 import os
+import asyncio
+import csv
+import io
+import time
 import logging
 import jwt
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional, Union
 import uuid
+import re
+import unicodedata
 from datetime import datetime, timedelta
 import bcrypt
+import orjson
+import zlib
+
+import access_log
+import archive_equipment
+import collab
+import compression
+import database
+import events
+import jobs
+import maintenance
+import metrics
+import packing_list
+import profiling
+import repair_work_centers
+import slow_queries
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (the client itself is created in the lifespan, see database.py)
+db = database.db
 
 # JWT configuration
 SECRET_KEY = "your-secret-key-here"
@@ -28,13 +51,86 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Health check configuration
+READINESS_PING_TIMEOUT_SECONDS = float(os.environ.get("READINESS_PING_TIMEOUT_SECONDS", "1.0"))
+
+# Startup progress, reported by /readyz
+startup_state = {
+    "started_at": time.time(),
+    "pool_warm_ms": None,
+    "indexes_ms": None,
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await database.connect(event_listeners=[
+        metrics.MongoCommandMetrics(),
+        access_log.DbTimeListener(),
+        slow_queries.SlowQueryListener(loop=asyncio.get_running_loop()),
+    ])
+    startup_state["pool_warm_ms"] = await database.warmup()
+    started = time.perf_counter()
+    await ensure_indexes()
+    startup_state["indexes_ms"] = (time.perf_counter() - started) * 1000
+    await events.bus.start(db)
+    collab.hub.start()
+    jobs.queue.start(db)
+    yield
+    await jobs.queue.stop()
+    await collab.hub.stop()
+    await events.bus.stop()
+    packing_list.shutdown()
+    database.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Soft delete: live documents store deleted_at = null. The hot queries use the partial
+# indexes built with this same expression in ensure_indexes(); plain null equality also
+# works on mongomock, which the benchmarks run against (it has no $type "null").
+NOT_DELETED = {"deleted_at": None}
+SOFT_DELETE_RETENTION_DAYS = int(os.environ.get("SOFT_DELETE_RETENTION_DAYS", "30"))
+
+def model_projection(model) -> dict:
+    # Only the model's fields: extra keys stored in a document never reach the client
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+def trusted_response(documents: list, model) -> ORJSONResponse:
+    """Return documents written through our models without re-validating them.
+
+    Returning a Response skips FastAPI's response_model validation and
+    jsonable_encoder pass; the response_model stays on the route for the docs.
+    Documents must be read with model_projection(model); fields missing from
+    older documents get the model's defaults, as response_model would.
+    """
+    defaults = {
+        name: field.default for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+    for document in documents:
+        for name, value in defaults.items():
+            if name not in document:
+                document[name] = value
+    return ORJSONResponse(content=documents)
+
+# Optimistic concurrency: every write does $inc version; updates may require the version read
+def version_filter(version: int) -> dict:
+    # Documents written before versioning have no field and count as version 0
+    if version == 0:
+        return {"version": {"$in": [0, None]}}
+    return {"version": version}
+
+def stale_write_response(detail: str, current: BaseModel) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=409,
+        content={"detail": detail, "documento_actual": current.dict()}
+    )
+
 # Predefined users
 USERS = {
     "Marco": "B33388091",
@@ -62,6 +158,15 @@ class WorkCenter(BaseModel):
     direccion: Optional[str] = None
     telefono: Optional[str] = None
 
+    @field_validator("id", "nombre")
+    @classmethod
+    def not_blank(cls, value: str) -> str:
+        # Reject empty ids/names at write time so reads never need to filter them
+        value = value.strip()
+        if not value:
+            raise ValueError("no puede estar vacío")
+        return value
+
 class Client(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     nombre: str
@@ -70,6 +175,13 @@ class Client(BaseModel):
     email: Optional[str] = None
     centros_trabajo: List[WorkCenter] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0
+    deleted_at: Optional[datetime] = None
+
+class ClientSummary(BaseModel):
+    id: str
+    nombre: str
+    cif: str
 
 class ClientCreate(BaseModel):
     nombre: str
@@ -78,6 +190,10 @@ class ClientCreate(BaseModel):
     email: Optional[str] = None
     centros_trabajo: List[WorkCenter] = []
 
+class ClientUpdate(ClientCreate):
+    # Version the caller last read; omit it for an unconditional write
+    version: Optional[int] = None
+
 class Equipment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     orden_trabajo: str
@@ -103,6 +219,8 @@ class Equipment(BaseModel):
     presupuesto_aceptado: Optional[bool] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0
+    deleted_at: Optional[datetime] = None
 
 class EquipmentCreate(BaseModel):
     orden_trabajo: str
@@ -121,19 +239,32 @@ class EquipmentCreate(BaseModel):
     numero_serie_sensor: Optional[str] = None
     fecha_instalacion_sensor: Optional[str] = None  # Changed to string to handle empty dates
 
+class EquipmentWithClient(Equipment):
+    cliente_cif: Optional[str] = None
+    cliente_telefono: Optional[str] = None
+    cliente_email: Optional[str] = None
+    centro_trabajo_direccion: Optional[str] = None
+    centro_trabajo_telefono: Optional[str] = None
+
+class ArchivedEquipment(Equipment):
+    archived_at: datetime
+
 class Manufacturer(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     nombre: str
+    deleted_at: Optional[datetime] = None
 
 class Model(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     nombre: str
     tipo_equipo: str
+    deleted_at: Optional[datetime] = None
 
 class FaultType(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     nombre: str
     requiere_sensor: bool = False
+    deleted_at: Optional[datetime] = None
 
 class PurchaseOrder(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -155,6 +286,19 @@ class ManufacturerResponseRequest(BaseModel):
 class ReceiveEquipmentRequest(BaseModel):
     equipment_ids: List[str]
 
+class MaintenanceRequest(BaseModel):
+    colecciones: Optional[List[str]] = None
+    creados_desde: Optional[datetime] = None
+    batch_size: int = Field(1000, ge=100, le=10000)
+
+# Projections for documents returned as-is by the listing routes
+EQUIPMENT_PROJECTION = model_projection(Equipment)
+ARCHIVED_EQUIPMENT_PROJECTION = model_projection(ArchivedEquipment)
+CLIENT_PROJECTION = model_projection(Client)
+
+# PUT /equipos/{id} sets these fields only; identity and bookkeeping fields are server-owned
+EQUIPMENT_EDITABLE_FIELDS = set(Equipment.model_fields) - {"id", "created_at", "updated_at", "version", "deleted_at"}
+
 # JWT functions
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -173,10 +317,69 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Token inválido")
+        access_log.set_request_user(username)
         return User(username=username)
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Token inválido")
 
+# Search key helpers
+def normalize_search_key(value: Optional[str]) -> str:
+    """Lowercase, accent-free form of a string used for prefix searches."""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+def normalize_cif_key(value: Optional[str]) -> str:
+    # CIFs are typed with or without separators ("B-33388091", "b 33388091")
+    return re.sub(r"[^0-9a-z]", "", normalize_search_key(value))
+
+def client_search_keys(nombre: Optional[str], cif: Optional[str]) -> dict:
+    return {
+        "nombre_busqueda": normalize_search_key(nombre),
+        "cif_busqueda": normalize_cif_key(cif),
+    }
+
+async def get_stream_user(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    # EventSource cannot send headers, so streams also accept ?token=
+    if credentials:
+        token = credentials.credentials
+    username = username_from_token(token)
+    if username is None:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    access_log.set_request_user(username)
+    return User(username=username)
+
+def username_from_token(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    return payload.get("sub")
+
+async def require_admin(current_user: User = Depends(get_current_user)):
+    if current_user.username != "admin":
+        raise HTTPException(status_code=403, detail="Solo el administrador puede realizar esta operación")
+    return current_user
+
+def is_admin_request(headers: dict) -> bool:
+    # Used by middleware that runs before the dependency system (raw ASGI headers)
+    authorization = headers.get(b"authorization", b"").decode()
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return False
+    return payload.get("sub") == "admin"
+
 # Authentication routes
 @api_router.post("/auth/login", response_model=Token)
 async def login(request: LoginRequest):
@@ -200,7 +403,7 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 @api_router.post("/clientes", response_model=Client)
 async def create_client(client: ClientCreate, current_user: User = Depends(get_current_user)):
     # Check if CIF already exists
-    existing_client = await db.clients.find_one({"cif": client.cif})
+    existing_client = await db.clients.find_one({"cif": client.cif, **NOT_DELETED})
     if existing_client:
         raise HTTPException(
             status_code=400, 
@@ -209,33 +412,122 @@ async def create_client(client: ClientCreate, current_user: User = Depends(get_c
     
     client_dict = client.dict()
     client_obj = Client(**client_dict)
-    await db.clients.insert_one(client_obj.dict())
+    await db.clients.insert_one({
+        **client_obj.dict(),
+        **client_search_keys(client_obj.nombre, client_obj.cif)
+    })
     return client_obj
 
-@api_router.get("/clientes", response_model=List[Client])
-async def get_clients(current_user: User = Depends(get_current_user)):
-    clients = await db.clients.find().to_list(1000)
-    return [Client(**client) for client in clients]
+# Sortable client fields; prefix with "-" for descending order
+CLIENT_SORT_FIELDS = {"nombre", "cif", "created_at"}
+CLIENT_COMPACT_PROJECTION = model_projection(ClientSummary)
+
+@api_router.get("/clientes", response_model=Union[List[Client], List[ClientSummary]])
+async def get_clients(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=1000),
+    sort: str = "nombre",
+    view: str = Query("full", pattern="^(full|compact)$"),
+    current_user: User = Depends(get_current_user)
+):
+    sort_field = sort.lstrip("-")
+    if sort_field not in CLIENT_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Campo de ordenación no válido: {sort_field}")
+    direction = -1 if sort.startswith("-") else 1
+    
+    # The compact view is for pickers: it leaves the embedded work centers in the database
+    projection = CLIENT_COMPACT_PROJECTION if view == "compact" else CLIENT_PROJECTION
+    cursor = db.clients.find(NOT_DELETED, projection).sort([(sort_field, direction), ("id", 1)]).skip(skip).limit(limit)
+    return trusted_response(await cursor.to_list(limit), ClientSummary if view == "compact" else Client)
+
+@api_router.get("/clientes/sugerir", response_model=List[ClientSummary])
+async def suggest_clients(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=25),
+    current_user: User = Depends(get_current_user)
+):
+    # Anchored prefix regexes on the normalized keys can use their indexes
+    or_filters = []
+    nombre_key = normalize_search_key(q)
+    if nombre_key:
+        or_filters.append({"nombre_busqueda": {"$regex": "^" + re.escape(nombre_key)}})
+    cif_key = normalize_cif_key(q)
+    if cif_key:
+        or_filters.append({"cif_busqueda": {"$regex": "^" + re.escape(cif_key)}})
+    if not or_filters:
+        return []
+    
+    clients = await db.clients.find(
+        {"$or": or_filters, **NOT_DELETED}, CLIENT_COMPACT_PROJECTION
+    ).sort("nombre_busqueda", 1).limit(limit).to_list(limit)
+    return trusted_response(clients, ClientSummary)
 
 @api_router.get("/clientes/{client_id}", response_model=Client)
 async def get_client_by_id(client_id: str, current_user: User = Depends(get_current_user)):
-    client = await db.clients.find_one({"id": client_id})
+    client = await db.clients.find_one({"id": client_id, **NOT_DELETED})
     if not client:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     return Client(**client)
 
+# Denormalized name propagation
+async def propagate_equipment_names(match: dict, field: str, value: str, batch_size: int = 1000):
+    """Copy a renamed client/work-center name onto the equipment that embeds it.
+
+    Runs after the rename response is sent. Works in id batches so a large
+    client never holds one long update, and skips rows that already match.
+    """
+    try:
+        stale_filter = {**match, **NOT_DELETED, field: {"$ne": value}}
+        updated = 0
+        while True:
+            batch = await db.equipment.find(stale_filter, {"_id": 0, "id": 1}).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            result = await db.equipment.update_many(
+                {"id": {"$in": [eq["id"] for eq in batch]}},
+                {"$set": {field: value}, "$inc": {"version": 1}}
+            )
+            updated += result.modified_count
+            if result.modified_count == 0:
+                break
+        logger.info("Propagated %s=%r to %d equipment records", field, value, updated)
+    except Exception:
+        logger.exception("Failed to propagate %s=%r to equipment", field, value)
+
+def schedule_name_propagation(background_tasks: BackgroundTasks, client_id: str, old_client: dict, new_client: dict):
+    if new_client.get("nombre") != old_client.get("nombre"):
+        background_tasks.add_task(
+            propagate_equipment_names, {"cliente_id": client_id}, "cliente_nombre", new_client["nombre"]
+        )
+    
+    old_names = {wc.get("id"): wc.get("nombre") for wc in old_client.get("centros_trabajo", [])}
+    for wc in new_client.get("centros_trabajo", []):
+        if wc.get("id") in old_names and old_names[wc["id"]] != wc.get("nombre"):
+            background_tasks.add_task(
+                propagate_equipment_names,
+                {"cliente_id": client_id, "centro_trabajo_id": wc["id"]},
+                "centro_trabajo_nombre",
+                wc["nombre"]
+            )
+
+CLIENT_CONFLICT_DETAIL = "El cliente ha sido modificado por otro usuario"
+
 @api_router.put("/clientes/{client_id}", response_model=Client)
-async def update_client(client_id: str, client_update: ClientCreate, current_user: User = Depends(get_current_user)):
+async def update_client(client_id: str, client_update: ClientUpdate, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
     # Find existing client
-    existing_client = await db.clients.find_one({"id": client_id})
+    existing_client = await db.clients.find_one({"id": client_id, **NOT_DELETED}, CLIENT_PROJECTION)
     if not existing_client:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    expected_version = client_update.version
+    if expected_version is not None and existing_client.get("version", 0) != expected_version:
+        return stale_write_response(CLIENT_CONFLICT_DETAIL, Client(**existing_client))
     
     # Check if CIF is being changed and if the new CIF already exists
     if client_update.cif != existing_client.get("cif"):
         cif_exists = await db.clients.find_one({
             "cif": client_update.cif,
-            "id": {"$ne": client_id}  # Exclude the current client
+            "id": {"$ne": client_id},  # Exclude the current client
+            **NOT_DELETED
         })
         if cif_exists:
             raise HTTPException(
@@ -244,75 +536,75 @@ async def update_client(client_id: str, client_update: ClientCreate, current_use
             )
     
     # Prepare update data - preserve work centers if not provided in update
-    update_data = client_update.dict()
+    update_data = client_update.dict(exclude={"version"})
     
     # If centros_trabajo is empty in the update, preserve existing ones
     if not update_data.get("centros_trabajo"):
         update_data["centros_trabajo"] = existing_client.get("centros_trabajo", [])
     
+    update_data.update(client_search_keys(client_update.nombre, client_update.cif))
     update_data["updated_at"] = datetime.utcnow()
     
-    result = await db.clients.update_one(
-        {"id": client_id}, 
-        {"$set": update_data}
+    # The version check is repeated in the filter in case of a write since the read above
+    client_filter = {"id": client_id, **NOT_DELETED}
+    if expected_version is not None:
+        client_filter.update(version_filter(expected_version))
+    updated_client = await db.clients.find_one_and_update(
+        client_filter,
+        {"$set": update_data, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    if updated_client is None:
+        current_client = await db.clients.find_one({"id": client_id, **NOT_DELETED}, CLIENT_PROJECTION)
+        if not current_client:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        return stale_write_response(CLIENT_CONFLICT_DETAIL, Client(**current_client))
+    
+    # Equipment keeps copies of client/work-center names; refresh them off the request path
+    schedule_name_propagation(background_tasks, client_id, existing_client, update_data)
     
-    # Return updated client
-    updated_client = await db.clients.find_one({"id": client_id})
     return Client(**updated_client)
 
 @api_router.get("/clientes/{client_id}/centros-trabajo", response_model=List[WorkCenter])
 async def get_client_work_centers(client_id: str, current_user: User = Depends(get_current_user)):
-    client = await db.clients.find_one({"id": client_id})
+    client = await db.clients.find_one({"id": client_id, **NOT_DELETED}, {"_id": 0, "centros_trabajo": 1})
     if not client:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
-    client_obj = Client(**client)
-    
-    # Filter out invalid work centers at the backend level
-    valid_work_centers = []
-    for wc in client_obj.centros_trabajo:
-        # Ensure both id and nombre are present and not empty
-        if (wc.id and str(wc.id).strip() and 
-            wc.nombre and str(wc.nombre).strip()):
-            valid_work_centers.append(wc)
-    
-    return valid_work_centers
+    # Work centers are validated on write; older ones are repaired at startup (ensure_indexes)
+    return [WorkCenter(**wc) for wc in client.get("centros_trabajo", [])]
 
 @api_router.post("/clientes/{client_id}/centros-trabajo", response_model=Client)
 async def add_work_center_to_client(client_id: str, work_center: WorkCenter, current_user: User = Depends(get_current_user)):
     # Find existing client
-    existing_client = await db.clients.find_one({"id": client_id})
+    existing_client = await db.clients.find_one({"id": client_id, **NOT_DELETED})
     if not existing_client:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
     # Add new work center
-    result = await db.clients.update_one(
-        {"id": client_id},
-        {"$push": {"centros_trabajo": work_center.dict()}}
+    updated_client = await db.clients.find_one_and_update(
+        {"id": client_id, **NOT_DELETED},
+        {"$push": {"centros_trabajo": work_center.dict()}, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
+    if updated_client is None:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
-    # Return updated client
-    updated_client = await db.clients.find_one({"id": client_id})
     return Client(**updated_client)
 
 @api_router.delete("/clientes/{client_id}/centros-trabajo/{work_center_id}")
 async def remove_work_center_from_client(client_id: str, work_center_id: str, current_user: User = Depends(get_current_user)):
     # Find existing client
-    existing_client = await db.clients.find_one({"id": client_id})
+    existing_client = await db.clients.find_one({"id": client_id, **NOT_DELETED})
     if not existing_client:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
     # Remove work center
     result = await db.clients.update_one(
-        {"id": client_id},
-        {"$pull": {"centros_trabajo": {"id": work_center_id}}}
+        {"id": client_id, "centros_trabajo.id": work_center_id, **NOT_DELETED},
+        {"$pull": {"centros_trabajo": {"id": work_center_id}}, "$inc": {"version": 1}}
     )
     
     if result.modified_count == 0:
@@ -320,6 +612,19 @@ async def remove_work_center_from_client(client_id: str, work_center_id: str, cu
     
     return {"message": "Centro de trabajo eliminado correctamente"}
 
+@api_router.delete("/clientes/{client_id}")
+async def delete_client(client_id: str, current_user: User = Depends(require_admin)):
+    # Equipment embeds the client's names; only clients with no live equipment can go
+    if await db.equipment.find_one({"cliente_id": client_id, **NOT_DELETED}, {"_id": 1}):
+        raise HTTPException(status_code=409, detail="El cliente tiene equipos activos y no se puede eliminar")
+    result = await db.clients.update_one(
+        {"id": client_id, **NOT_DELETED},
+        {"$set": {"deleted_at": datetime.utcnow()}, "$inc": {"version": 1}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    return {"message": "Cliente eliminado correctamente"}
+
 # Equipment routes
 @api_router.post("/equipos", response_model=Equipment)
 async def create_equipment(equipment: EquipmentCreate, current_user: User = Depends(get_current_user)):
@@ -349,57 +654,253 @@ async def create_equipment(equipment: EquipmentCreate, current_user: User = Depe
     
     equipment_obj = Equipment(**equipment_dict)
     await db.equipment.insert_one(equipment_obj.dict())
+    events.bus.emit("equipment.created", [equipment_obj.id])
     return equipment_obj
 
 @api_router.get("/equipos", response_model=List[Equipment])
 async def get_equipment(current_user: User = Depends(get_current_user)):
-    equipment = await db.equipment.find().to_list(1000)
-    return [Equipment(**eq) for eq in equipment]
+    equipment = await db.equipment.find(NOT_DELETED, EQUIPMENT_PROJECTION).to_list(1000)
+    return trusted_response(equipment, Equipment)
 
 @api_router.get("/equipos/pendientes", response_model=List[Equipment])
 async def get_pending_equipment(current_user: User = Depends(get_current_user)):
-    equipment = await db.equipment.find({"estado": "Pendiente"}).to_list(1000)
-    return [Equipment(**eq) for eq in equipment]
+    equipment = await db.equipment.find({**NOT_DELETED, "estado": "Pendiente"}, EQUIPMENT_PROJECTION).to_list(1000)
+    return trusted_response(equipment, Equipment)
 
 @api_router.get("/equipos/para-recepcion", response_model=List[Equipment])
 async def get_equipment_for_reception(current_user: User = Depends(get_current_user)):
     # Equipment that has warranty or budget and is ready for reception
     equipment = await db.equipment.find({
+        **NOT_DELETED,
         "estado": "En Fabricante",
         "$or": [
             {"en_garantia": True},
             {"numero_presupuesto": {"$ne": None}}
         ]
-    }).to_list(1000)
-    return [Equipment(**eq) for eq in equipment]
+    }, EQUIPMENT_PROJECTION).to_list(1000)
+    return trusted_response(equipment, Equipment)
 
 @api_router.get("/equipos/completados", response_model=List[Equipment])
 async def get_completed_equipment(current_user: User = Depends(get_current_user)):
-    equipment = await db.equipment.find({"estado": "Recibido"}).to_list(1000)
-    return [Equipment(**eq) for eq in equipment]
+    equipment = await db.equipment.find({**NOT_DELETED, "estado": "Recibido"}, EQUIPMENT_PROJECTION).to_list(1000)
+    return trusted_response(equipment, Equipment)
+
+# Completed units moved out of `equipment` by archive_equipment.py
+@api_router.get("/equipos/archivo", response_model=List[ArchivedEquipment])
+async def search_archived_equipment(
+    cliente_id: Optional[str] = None,
+    numero_serie: Optional[str] = None,
+    orden_trabajo: Optional[str] = None,
+    numero_orden_compra: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: User = Depends(get_current_user)
+):
+    query = {}
+    for field, value in (
+        ("cliente_id", cliente_id),
+        ("numero_serie", numero_serie),
+        ("orden_trabajo", orden_trabajo),
+        ("numero_orden_compra", numero_orden_compra),
+    ):
+        if value:
+            query[field] = value
+    # Date range on updated_at, i.e. when the unit was received
+    if desde or hasta:
+        query["updated_at"] = {}
+        if desde:
+            query["updated_at"]["$gte"] = desde
+        if hasta:
+            query["updated_at"]["$lt"] = hasta
+    
+    cursor = db.equipment_archive.find(query, ARCHIVED_EQUIPMENT_PROJECTION).sort([("updated_at", -1), ("id", 1)])
+    return trusted_response(await cursor.skip(skip).limit(limit).to_list(limit), ArchivedEquipment)
+
+@api_router.get("/equipos/con-cliente", response_model=List[EquipmentWithClient])
+async def get_equipment_with_client(
+    estado: Optional[str] = None,
+    numero_orden_compra: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    match = dict(NOT_DELETED)
+    if estado:
+        match["estado"] = estado
+    if numero_orden_compra:
+        match["numero_orden_compra"] = numero_orden_compra
+    if cliente_id:
+        match["cliente_id"] = cliente_id
+    
+    # Join client contact details and the matching work center server-side (index on clients.id)
+    pipeline = [
+        {"$match": match},
+        {"$limit": limit},
+        {"$lookup": {
+            "from": "clients",
+            "localField": "cliente_id",
+            "foreignField": "id",
+            "as": "cliente"
+        }},
+        {"$unwind": {"path": "$cliente", "preserveNullAndEmptyArrays": True}},
+        {"$addFields": {
+            "centro": {"$arrayElemAt": [{"$filter": {
+                "input": {"$ifNull": ["$cliente.centros_trabajo", []]},
+                "as": "wc",
+                "cond": {"$eq": ["$$wc.id", "$centro_trabajo_id"]}
+            }}, 0]}
+        }},
+        {"$addFields": {
+            "cliente_cif": "$cliente.cif",
+            "cliente_telefono": "$cliente.telefono",
+            "cliente_email": "$cliente.email",
+            "centro_trabajo_direccion": "$centro.direccion",
+            "centro_trabajo_telefono": "$centro.telefono"
+        }},
+        {"$project": {"_id": 0, "cliente": 0, "centro": 0}}
+    ]
+    equipment = await db.equipment.aggregate(pipeline).to_list(limit)
+    return [EquipmentWithClient(**eq) for eq in equipment]
+
+EXPORT_DATE_FIELDS = ("created_at", "updated_at")
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+async def export_lines(cursor, formato: str):
+    if formato == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(["Orden de Compra"] + packing_list.HEADER)
+        yield buffer.getvalue().encode("utf-8")
+        async for eq in cursor:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([packing_list.safe_cell(eq.get("numero_orden_compra"))] + packing_list.equipment_row(eq))
+            yield buffer.getvalue().encode("utf-8")
+    else:
+        async for eq in cursor:
+            yield orjson.dumps(eq) + b"\n"
+
+async def export_chunks(lines, gzip: bool):
+    # Rows are batched into ~64 KB chunks; with gzip each chunk is compressed as it is sent
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    pending = []
+    size = 0
+    async for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(pending)
+            yield compressor.compress(chunk) if compressor else chunk
+            pending = []
+            size = 0
+    chunk = b"".join(pending)
+    yield compressor.compress(chunk) + compressor.flush() if compressor else chunk
+
+@api_router.get("/equipos/exportar")
+async def export_equipment_range(
+    campo_fecha: str = "created_at",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    estado: Optional[str] = None,
+    fabricante: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+    formato: str = "csv",
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    if campo_fecha not in EXPORT_DATE_FIELDS:
+        raise HTTPException(status_code=400, detail="campo_fecha debe ser created_at o updated_at")
+    if formato not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (csv o ndjson)")
+    query = dict(NOT_DELETED)
+    for field, value in (("estado", estado), ("fabricante", fabricante), ("cliente_id", cliente_id)):
+        if value:
+            query[field] = value
+    if desde or hasta:
+        query[campo_fecha] = {}
+        if desde:
+            query[campo_fecha]["$gte"] = desde
+        if hasta:
+            query[campo_fecha]["$lt"] = hasta
+
+    # One cursor walking the (date, id) index in order; memory stays flat whatever the range
+    cursor = db.equipment.find(query, EQUIPMENT_PROJECTION).sort([(campo_fecha, 1), ("id", 1)]).batch_size(1000)
+    filename = f"equipos_{desde:%Y%m%d}" if desde else "equipos"
+    if hasta:
+        filename += f"_{hasta:%Y%m%d}"
+    filename += f".{formato}"
+    media_type = EXPORT_FORMATS[formato]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_chunks(export_lines(cursor, formato), gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @api_router.get("/equipos/{equipment_id}", response_model=Equipment)
 async def get_equipment_by_id(equipment_id: str, current_user: User = Depends(get_current_user)):
-    equipment = await db.equipment.find_one({"id": equipment_id})
+    equipment = await db.equipment.find_one({"id": equipment_id, **NOT_DELETED})
     if not equipment:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     return Equipment(**equipment)
 
 @api_router.put("/equipos/{equipment_id}", response_model=Equipment)
 async def update_equipment(equipment_id: str, updates: dict, current_user: User = Depends(get_current_user)):
+    # "version" is the version the caller last read; without it the write is unconditional
+    expected_version = updates.pop("version", None)
+    unknown = sorted(set(updates) - EQUIPMENT_EDITABLE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos no editables: {', '.join(unknown)}")
     updates["updated_at"] = datetime.utcnow()
-    result = await db.equipment.update_one({"id": equipment_id}, {"$set": updates})
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    equipment_filter = {"id": equipment_id, **NOT_DELETED}
+    if expected_version is not None:
+        if not isinstance(expected_version, int):
+            raise HTTPException(status_code=400, detail="La versión debe ser un número entero")
+        equipment_filter.update(version_filter(expected_version))
+    equipment = await db.equipment.find_one_and_update(
+        equipment_filter,
+        {"$set": updates, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if equipment is None:
+        current = await db.equipment.find_one({"id": equipment_id, **NOT_DELETED}, EQUIPMENT_PROJECTION)
+        if not current:
+            raise HTTPException(status_code=404, detail="Equipo no encontrado")
+        return stale_write_response("El equipo ha sido modificado por otro usuario", Equipment(**current))
+    events.bus.emit("equipment.updated", [equipment_id], {**updates, "version": equipment["version"]})
     
-    equipment = await db.equipment.find_one({"id": equipment_id})
     return Equipment(**equipment)
 
+@api_router.delete("/equipos/{equipment_id}")
+async def delete_equipment(equipment_id: str, current_user: User = Depends(get_current_user)):
+    # Soft delete: hidden from every listing now, purged by the TTL index after the retention period
+    now = datetime.utcnow()
+    result = await db.equipment.update_one(
+        {"id": equipment_id, **NOT_DELETED},
+        {"$set": {"deleted_at": now, "updated_at": now}, "$inc": {"version": 1}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    events.bus.emit("equipment.deleted", [equipment_id])
+    return {"message": "Equipo eliminado correctamente"}
+
+async def soft_delete_reference(collection, item_id: str, not_found: str):
+    result = await collection.update_one(
+        {"id": item_id, **NOT_DELETED}, {"$set": {"deleted_at": datetime.utcnow()}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=404, detail=not_found)
+
 # Reference data routes
 @api_router.get("/fabricantes", response_model=List[Manufacturer])
 async def get_manufacturers(current_user: User = Depends(get_current_user)):
-    manufacturers = await db.manufacturers.find().to_list(1000)
-    return [Manufacturer(**mf) for mf in manufacturers]
+    manufacturers = await db.manufacturers.find(NOT_DELETED, model_projection(Manufacturer)).to_list(1000)
+    return trusted_response(manufacturers, Manufacturer)
 
 @api_router.post("/fabricantes", response_model=Manufacturer)
 async def create_manufacturer(name: str, current_user: User = Depends(get_current_user)):
@@ -407,10 +908,15 @@ async def create_manufacturer(name: str, current_user: User = Depends(get_curren
     await db.manufacturers.insert_one(manufacturer.dict())
     return manufacturer
 
+@api_router.delete("/fabricantes/{manufacturer_id}")
+async def delete_manufacturer(manufacturer_id: str, current_user: User = Depends(require_admin)):
+    await soft_delete_reference(db.manufacturers, manufacturer_id, "Fabricante no encontrado")
+    return {"message": "Fabricante eliminado correctamente"}
+
 @api_router.get("/modelos", response_model=List[Model])
 async def get_models(current_user: User = Depends(get_current_user)):
-    models = await db.models.find().to_list(1000)
-    return [Model(**model) for model in models]
+    models = await db.models.find(NOT_DELETED, model_projection(Model)).to_list(1000)
+    return trusted_response(models, Model)
 
 @api_router.post("/modelos", response_model=Model)
 async def create_model(name: str, equipment_type: str, current_user: User = Depends(get_current_user)):
@@ -418,10 +924,16 @@ async def create_model(name: str, equipment_type: str, current_user: User = Depe
     await db.models.insert_one(model.dict())
     return model
 
+@api_router.delete("/modelos/{model_id}")
+async def delete_model(model_id: str, current_user: User = Depends(require_admin)):
+    await soft_delete_reference(db.models, model_id, "Modelo no encontrado")
+    return {"message": "Modelo eliminado correctamente"}
+
 @api_router.get("/tipos-fallo", response_model=List[FaultType])
 async def get_fault_types(current_user: User = Depends(get_current_user)):
-    fault_types = await db.fault_types.find().to_list(1000)
-    if not fault_types:
+    fault_types = await db.fault_types.find(NOT_DELETED, model_projection(FaultType)).to_list(1000)
+    # Seed only an empty collection, not one whose entries were all deleted
+    if not fault_types and not await db.fault_types.count_documents({}, limit=1):
         # Initialize default fault types
         default_fault_types = [
             FaultType(nombre="SENSOR LEAKING ACID, PCB DAMAGED", requiere_sensor=True),
@@ -433,7 +945,7 @@ async def get_fault_types(current_user: User = Depends(get_current_user)):
         for ft in default_fault_types:
             await db.fault_types.insert_one(ft.dict())
         return default_fault_types
-    return [FaultType(**ft) for ft in fault_types]
+    return trusted_response(fault_types, FaultType)
 
 @api_router.post("/tipos-fallo", response_model=FaultType)
 async def create_fault_type(name: str, requires_sensor: bool = False, current_user: User = Depends(get_current_user)):
@@ -441,35 +953,82 @@ async def create_fault_type(name: str, requires_sensor: bool = False, current_us
     await db.fault_types.insert_one(fault_type.dict())
     return fault_type
 
+@api_router.delete("/tipos-fallo/{fault_type_id}")
+async def delete_fault_type(fault_type_id: str, current_user: User = Depends(require_admin)):
+    await soft_delete_reference(db.fault_types, fault_type_id, "Tipo de fallo no encontrado")
+    return {"message": "Tipo de fallo eliminado correctamente"}
+
 # Purchase order routes
 @api_router.get("/ordenes-compra", response_model=List[PurchaseOrder])
 async def get_purchase_orders(current_user: User = Depends(get_current_user)):
-    orders = await db.purchase_orders.find().to_list(1000)
-    return [PurchaseOrder(**order) for order in orders]
+    orders = await db.purchase_orders.find({}, model_projection(PurchaseOrder)).to_list(1000)
+    return trusted_response(orders, PurchaseOrder)
 
 @api_router.get("/ordenes-compra/activas")
 async def get_active_purchase_orders(current_user: User = Depends(get_current_user)):
     # Get purchase orders that have equipment in "Enviado" state
     equipment_with_po = await db.equipment.find(
-        {"estado": "Enviado", "numero_orden_compra": {"$ne": None}}
+        {**NOT_DELETED, "estado": "Enviado", "numero_orden_compra": {"$ne": None}}
     ).to_list(1000)
     
     active_pos = list(set([eq["numero_orden_compra"] for eq in equipment_with_po]))
     return {"active_orders": active_pos}
 
+EQUIPMENT_STATES = ("Pendiente", "Enviado", "En Fabricante", "Recibido")
+
+@api_router.get("/ordenes-compra/resumen")
+async def get_purchase_order_summary(current_user: User = Depends(get_current_user)):
+    # Per-PO rollup in a single $group instead of one /equipos call per order
+    def count_if(condition):
+        return {"$sum": {"$cond": [condition, 1, 0]}}
+
+    pipeline = [
+        {"$match": {**NOT_DELETED, "numero_orden_compra": {"$ne": None}}},
+        {"$group": {
+            "_id": "$numero_orden_compra",
+            "total": {"$sum": 1},
+            **{f"estado_{index}": count_if({"$eq": ["$estado", state]}) for index, state in enumerate(EQUIPMENT_STATES)},
+            "en_garantia": count_if({"$eq": ["$en_garantia", True]}),
+            "fuera_garantia": count_if({"$eq": ["$en_garantia", False]}),
+            # $min skips the nulls, so this is the oldest unit not yet received
+            "pendiente_desde": {"$min": {"$cond": [{"$ne": ["$estado", "Recibido"]}, "$created_at", None]}},
+            "ultima_actividad": {"$max": "$updated_at"},
+        }},
+        {"$sort": {"ultima_actividad": -1}},
+    ]
+    now = datetime.utcnow()
+    summary = []
+    async for group in db.equipment.aggregate(pipeline):
+        oldest = group["pendiente_desde"]
+        summary.append({
+            "numero_orden": group["_id"],
+            "total": group["total"],
+            "por_estado": {state: group[f"estado_{index}"] for index, state in enumerate(EQUIPMENT_STATES)},
+            "garantia": {
+                "en_garantia": group["en_garantia"],
+                "fuera_garantia": group["fuera_garantia"],
+                "sin_respuesta": group["total"] - group["en_garantia"] - group["fuera_garantia"],
+            },
+            "pendiente_desde": oldest,
+            "antiguedad_pendiente_dias": (now - oldest).days if oldest else None,
+            "ultima_actividad": group["ultima_actividad"],
+        })
+    return summary
+
 @api_router.get("/ordenes-compra/{order_number}/equipos", response_model=List[Equipment])
 async def get_equipment_by_purchase_order(order_number: str, current_user: User = Depends(get_current_user)):
-    equipment = await db.equipment.find({"numero_orden_compra": order_number}).to_list(1000)
-    return [Equipment(**eq) for eq in equipment]
+    equipment = await db.equipment.find({**NOT_DELETED, "numero_orden_compra": order_number}, EQUIPMENT_PROJECTION).to_list(1000)
+    return trusted_response(equipment, Equipment)
 
 @api_router.get("/ordenes-compra/{order_number}/equipos/enviados", response_model=List[Equipment])
 async def get_sent_equipment_by_purchase_order(order_number: str, current_user: User = Depends(get_current_user)):
     # Only equipment that is still in "Enviado" state (not processed by manufacturer yet)
     equipment = await db.equipment.find({
+        **NOT_DELETED,
         "numero_orden_compra": order_number, 
         "estado": "Enviado"
-    }).to_list(1000)
-    return [Equipment(**eq) for eq in equipment]
+    }, EQUIPMENT_PROJECTION).to_list(1000)
+    return trusted_response(equipment, Equipment)
 
 @api_router.post("/ordenes-compra/asignar")
 async def assign_purchase_order(request: AssignPurchaseOrderRequest, current_user: User = Depends(get_current_user)):
@@ -485,19 +1044,23 @@ async def assign_purchase_order(request: AssignPurchaseOrderRequest, current_use
         await db.purchase_orders.insert_one(order.dict())
     
     # Update equipment status
+    updates = {
+        "numero_orden_compra": request.numero_orden, 
+        "estado": "Enviado", 
+        "updated_at": datetime.utcnow()
+    }
     await db.equipment.update_many(
-        {"id": {"$in": request.equipment_ids}},
-        {"$set": {
-            "numero_orden_compra": request.numero_orden, 
-            "estado": "Enviado", 
-            "updated_at": datetime.utcnow()
-        }}
+        {"id": {"$in": request.equipment_ids}, **NOT_DELETED},
+        {"$set": updates, "$inc": {"version": 1}}
     )
+    events.bus.emit("equipment.updated", request.equipment_ids, updates)
+    collab.hub.equipment_changed(request.numero_orden, request.equipment_ids, updates)
     
     return {"message": "Orden de compra asignada correctamente", "assigned_count": len(request.equipment_ids)}
 
 @api_router.post("/ordenes-compra/{order_number}/respuesta-fabricante")
 async def manufacturer_response(order_number: str, request: ManufacturerResponseRequest, current_user: User = Depends(get_current_user)):
+    ensure_not_locked(order_number, request.equipment_ids, current_user)
     # Update selected equipment with manufacturer response
     updates = {
         "numero_recepcion_fabricante": request.numero_recepcion_fabricante,
@@ -511,9 +1074,14 @@ async def manufacturer_response(order_number: str, request: ManufacturerResponse
         updates["presupuesto_aceptado"] = request.presupuesto_aceptado
     
     result = await db.equipment.update_many(
-        {"id": {"$in": request.equipment_ids}, "numero_orden_compra": order_number},
-        {"$set": updates}
+        {"id": {"$in": request.equipment_ids}, "numero_orden_compra": order_number, **NOT_DELETED},
+        {"$set": updates, "$inc": {"version": 1}}
     )
+    if result.modified_count:
+        events.bus.emit("equipment.updated", request.equipment_ids, updates)
+        collab.hub.equipment_changed(order_number, request.equipment_ids, updates)
+        # The units now show up on the reception screen
+        collab.hub.equipment_changed(collab.RECEPTION_ROOM, request.equipment_ids, updates)
     
     return {
         "message": "Respuesta de fabricante registrada correctamente", 
@@ -522,20 +1090,99 @@ async def manufacturer_response(order_number: str, request: ManufacturerResponse
 
 @api_router.post("/equipos/recibir")
 async def receive_equipment(request: ReceiveEquipmentRequest, current_user: User = Depends(get_current_user)):
+    ensure_not_locked(collab.RECEPTION_ROOM, request.equipment_ids, current_user)
     # Mark equipment as received
+    updates = {
+        "estado": "Recibido",
+        "updated_at": datetime.utcnow()
+    }
     result = await db.equipment.update_many(
-        {"id": {"$in": request.equipment_ids}},
-        {"$set": {
-            "estado": "Recibido",
-            "updated_at": datetime.utcnow()
-        }}
+        {"id": {"$in": request.equipment_ids}, **NOT_DELETED},
+        {"$set": updates, "$inc": {"version": 1}}
     )
+    if result.modified_count:
+        events.bus.emit("equipment.updated", request.equipment_ids, updates)
+        collab.hub.equipment_changed(collab.RECEPTION_ROOM, request.equipment_ids, updates)
     
     return {
         "message": "Equipos marcados como recibidos correctamente",
         "received_count": result.modified_count
     }
 
+# Live equipment events (Server-Sent Events)
+SSE_HEARTBEAT_SECONDS = 15
+
+@api_router.get("/eventos")
+async def stream_events(request: Request, current_user: User = Depends(get_stream_user)):
+    subscription = events.bus.subscribe()
+    
+    async def event_stream():
+        try:
+            yield f"retry: 3000\n: source {events.bus.source}\n\n".encode()
+            while not await request.is_disconnected():
+                try:
+                    event = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield b": ping\n\n"
+                    continue
+                yield b"id: %d\nevent: %s\ndata: %s\n\n" % (
+                    event["id"], event["type"].encode(), orjson.dumps(event)
+                )
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Collaborative selection on the bulk screens (WebSocket)
+def ensure_not_locked(room: str, equipment_ids: List[str], current_user: User):
+    held = collab.hub.locked_by_others(room, equipment_ids, current_user.username)
+    if held:
+        users = ", ".join(sorted(set(held.values())))
+        raise HTTPException(
+            status_code=409,
+            detail=f"{len(held)} equipo(s) seleccionados por otro técnico: {users}"
+        )
+
+async def collaboration_socket(websocket: WebSocket, room: str):
+    # Browsers cannot set headers on a WebSocket, so the token comes as ?token=
+    username = username_from_token(websocket.query_params.get("token"))
+    if username is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    connection = await collab.hub.join(
+        room, username,
+        send=lambda payload: websocket.send_text(payload.decode()),
+        close=lambda code: websocket.close(code=code),
+    )
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = orjson.loads(text)
+            except orjson.JSONDecodeError:
+                continue
+            if isinstance(message, dict):
+                await collab.hub.handle_message(connection, message)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the hub closed the socket (heartbeat timeout or slow client)
+        pass
+    finally:
+        await collab.hub.leave(connection)
+
+@api_router.websocket("/ws/ordenes-compra/{order_number}")
+async def purchase_order_socket(websocket: WebSocket, order_number: str):
+    await collaboration_socket(websocket, order_number)
+
+@api_router.websocket("/ws/recepcion")
+async def reception_socket(websocket: WebSocket):
+    await collaboration_socket(websocket, collab.RECEPTION_ROOM)
+
 # Database cleanup endpoint (for development/testing)
 @api_router.post("/admin/clear-database")
 async def clear_database(current_user: User = Depends(get_current_user)):
@@ -563,31 +1210,262 @@ async def clear_database(current_user: User = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al limpiar la base de datos: {str(e)}")
 
-# CSV Export endpoint
+@api_router.post("/admin/archivar", status_code=status.HTTP_202_ACCEPTED)
+async def archive_equipment_route(
+    meses: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(require_admin)
+):
+    # Defaults to ARCHIVE_AFTER_MONTHS (12); follow it at GET /trabajos/{id}
+    months = meses or archive_equipment.default_months()
+    try:
+        return await jobs.queue.submit("archivar", {"meses": months}, current_user.username, exclusive="archivar")
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="Ya hay un archivado en curso")
+
+@jobs.queue.handler("archivar")
+async def archive_equipment_job(context: jobs.JobContext, meses: int):
+    stats = await archive_equipment.archive_completed_equipment(context.db, meses, context=context)
+    logger.info("Archived %d equipment records (%d skipped)", stats["archived"], stats["skipped"])
+
+# Maintenance jobs (see maintenance.py); they run on the job queue and can be cancelled
+@api_router.post("/admin/mantenimiento/{operacion}", status_code=status.HTTP_202_ACCEPTED)
+async def start_maintenance(
+    operacion: str,
+    request: Optional[MaintenanceRequest] = None,
+    current_user: User = Depends(require_admin)
+):
+    params = (request or MaintenanceRequest()).dict(exclude_none=True)
+    try:
+        return await maintenance.submit(operacion, params, current_user.username)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Operación de mantenimiento desconocida: {operacion}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+MAINTENANCE_JOB_KINDS = list(maintenance.OPERATIONS) + ["archivar"]
+
+async def get_maintenance_job_or_404(job_id: str) -> dict:
+    job = await jobs.queue.get(job_id)
+    if not job or job["tipo"] not in MAINTENANCE_JOB_KINDS:
+        raise HTTPException(status_code=404, detail="Trabajo de mantenimiento no encontrado")
+    return job
+
+@api_router.get("/admin/mantenimiento/trabajos")
+async def list_maintenance_jobs(current_user: User = Depends(require_admin)):
+    return await db.jobs.find(
+        {"tipo": {"$in": MAINTENANCE_JOB_KINDS}}, {"_id": 0}
+    ).sort("created_at", -1).to_list(50)
+
+@api_router.get("/admin/mantenimiento/trabajos/{job_id}")
+async def get_maintenance_job(job_id: str, current_user: User = Depends(require_admin)):
+    return await get_maintenance_job_or_404(job_id)
+
+@api_router.post("/admin/mantenimiento/trabajos/{job_id}/cancelar")
+async def cancel_maintenance_job(job_id: str, current_user: User = Depends(require_admin)):
+    await get_maintenance_job_or_404(job_id)
+    job = await jobs.queue.cancel(job_id)
+    return {"message": "Cancelación solicitada", "estado": job["estado"]}
+
+# Request profiles captured with the X-Profile header
+@api_router.get("/admin/perfiles")
+async def list_request_profiles(current_user: User = Depends(require_admin)):
+    return profiling.list_profiles()
+
+@api_router.get("/admin/perfiles/{profile_id}")
+async def get_request_profile(profile_id: str, current_user: User = Depends(require_admin)):
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return profile
+
+# Query shapes issued by the standard routes, checked by /admin/explain.
+# Values are placeholders: only the plan shape matters.
+ROUTE_QUERIES = [
+    ("GET /equipos", "equipment", NOT_DELETED, None),
+    ("GET /equipos/pendientes", "equipment", {**NOT_DELETED, "estado": "Pendiente"}, None),
+    ("GET /equipos/para-recepcion", "equipment", {
+        **NOT_DELETED,
+        "estado": "En Fabricante",
+        "$or": [{"en_garantia": True}, {"numero_presupuesto": {"$ne": None}}]
+    }, None),
+    ("GET /equipos/completados", "equipment", {**NOT_DELETED, "estado": "Recibido"}, None),
+    ("GET /equipos/{id}", "equipment", {"id": "explain", **NOT_DELETED}, None),
+    ("GET /equipos/archivo?numero_serie", "equipment_archive", {"numero_serie": "explain"}, [("updated_at", -1), ("id", 1)]),
+    ("GET /equipos/archivo?cliente_id", "equipment_archive", {"cliente_id": "explain"}, [("updated_at", -1), ("id", 1)]),
+    ("GET /equipos/exportar", "equipment", {**NOT_DELETED, "created_at": {"$gte": datetime(2000, 1, 1)}}, [("created_at", 1), ("id", 1)]),
+    ("GET /equipos/exportar?campo_fecha=updated_at", "equipment", {
+        **NOT_DELETED, "estado": "explain", "updated_at": {"$gte": datetime(2000, 1, 1)}
+    }, [("updated_at", 1), ("id", 1)]),
+    ("GET /equipos/con-cliente?cliente_id", "equipment", {**NOT_DELETED, "cliente_id": "explain"}, None),
+    ("GET /ordenes-compra/activas", "equipment", {**NOT_DELETED, "estado": "Enviado", "numero_orden_compra": {"$ne": None}}, None),
+    ("GET /ordenes-compra/resumen", "equipment", {**NOT_DELETED, "numero_orden_compra": {"$ne": None}}, None),
+    ("GET /ordenes-compra/{n}/equipos", "equipment", {**NOT_DELETED, "numero_orden_compra": "explain"}, None),
+    ("GET /ordenes-compra/{n}/equipos/enviados", "equipment", {**NOT_DELETED, "numero_orden_compra": "explain", "estado": "Enviado"}, None),
+    ("GET /clientes", "clients", NOT_DELETED, [("nombre", 1), ("id", 1)]),
+    ("GET /clientes/{id}", "clients", {"id": "explain", **NOT_DELETED}, None),
+    ("POST /clientes (CIF)", "clients", {"cif": "explain", **NOT_DELETED}, None),
+    ("GET /clientes/sugerir", "clients", {"$or": [
+        {"nombre_busqueda": {"$regex": "^explain"}}, {"cif_busqueda": {"$regex": "^explain"}}
+    ], **NOT_DELETED}, [("nombre_busqueda", 1)]),
+    ("POST /ordenes-compra/asignar", "purchase_orders", {"numero_orden": "explain"}, None),
+]
+
+@api_router.get("/admin/explain")
+async def explain_route_queries(current_user: User = Depends(require_admin)):
+    # Full-collection listings are expected to scan; everything else should hit an index
+    results = []
+    for name, collection, query, sort in ROUTE_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        summary = slow_queries.summarize_explain(await cursor.explain())
+        results.append({
+            "route": name,
+            "collection": collection,
+            "filter": slow_queries.redact(query),
+            **summary,
+            # The soft-delete predicate alone does not make a listing selective
+            "needs_index": summary["collscan"] and any(field != "deleted_at" for field in query),
+        })
+    return {
+        "queries": results,
+        "collscan_count": sum(1 for result in results if result["needs_index"])
+    }
+
+# Purchase order exports (CSV, XLSX and PDF packing list; see packing_list.py)
+async def purchase_order_equipment(order_number: str, limit: Optional[int] = None) -> List[dict]:
+    # Stable order so the same contents always give the same export (and cache key)
+    return await db.equipment.find(
+        {**NOT_DELETED, "numero_orden_compra": order_number}, {"_id": 0}
+    ).sort([("orden_trabajo", 1), ("id", 1)]).to_list(limit)
+
+def purchase_order_csv(equipment: List[dict]) -> str:
+    return packing_list.render_csv(packing_list.equipment_rows(equipment))
+
 @api_router.get("/ordenes-compra/{order_number}/export-csv")
 async def export_purchase_order_csv(order_number: str, current_user: User = Depends(get_current_user)):
-    equipment = await db.equipment.find({"numero_orden_compra": order_number}).to_list(1000)
+    # Inline variant kept for existing callers; the UI uses the job below
+    equipment = await purchase_order_equipment(order_number, 1000)
     
     if not equipment:
         raise HTTPException(status_code=404, detail="No se encontraron equipos para esta orden de compra")
     
-    # Generate CSV content with work center
-    csv_header = "Orden de Trabajo,Cliente,Centro de Trabajo,Tipo de Equipo,Modelo,Fabricante,Numero de Serie,Estado,Fecha Creacion\n"
-    csv_rows = []
-    
-    for eq in equipment:
-        centro_trabajo = eq.get('centro_trabajo_nombre', '') or ''
-        row = f"{eq['orden_trabajo']},{eq['cliente_nombre']},{centro_trabajo},{eq['tipo_equipo']},{eq['modelo']},{eq['fabricante']},{eq['numero_serie']},{eq['estado']},{eq['created_at'].strftime('%Y-%m-%d')}\n"
-        csv_rows.append(row)
-    
-    csv_content = csv_header + "".join(csv_rows)
-    
     return {
         "filename": f"orden_compra_{order_number}.csv",
-        "content": csv_content,
+        "content": purchase_order_csv(equipment),
         "equipment_count": len(equipment)
     }
 
+@api_router.post("/ordenes-compra/{order_number}/export-csv", status_code=status.HTTP_202_ACCEPTED)
+async def submit_purchase_order_csv(order_number: str, current_user: User = Depends(get_current_user)):
+    if not await db.equipment.find_one({**NOT_DELETED, "numero_orden_compra": order_number}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="No se encontraron equipos para esta orden de compra")
+    return await jobs.queue.submit("exportar-csv", {"numero_orden": order_number}, current_user.username)
+
+@jobs.queue.handler("exportar-csv")
+async def export_purchase_order_csv_job(context: jobs.JobContext, numero_orden: str) -> jobs.JobResult:
+    equipment = await purchase_order_equipment(numero_orden)
+    await context.report(equipos=len(equipment))
+    return jobs.JobResult(
+        purchase_order_csv(equipment).encode("utf-8"), f"orden_compra_{numero_orden}.csv", "text/csv; charset=utf-8"
+    )
+
+@api_router.get("/ordenes-compra/{order_number}/packing-list/{formato}")
+async def export_packing_list(order_number: str, formato: str, request: Request, current_user: User = Depends(get_current_user)):
+    if formato not in packing_list.FORMATS:
+        raise HTTPException(status_code=404, detail="Formato no soportado (xlsx o pdf)")
+    equipment = await purchase_order_equipment(order_number)
+    if not equipment:
+        raise HTTPException(status_code=404, detail="No se encontraron equipos para esta orden de compra")
+
+    rows = packing_list.equipment_rows(equipment)
+    etag = f'"{packing_list.content_hash(formato, order_number, rows)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    content = await packing_list.render_cached(db, formato, order_number, rows)
+    media_type, extension = packing_list.FORMATS[formato]
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "ETag": etag,
+            "Content-Disposition": f'attachment; filename="packing_list_{order_number}.{extension}"',
+        }
+    )
+
+# Background job status and results (see jobs.py)
+async def get_visible_job(job_id: str, current_user: User) -> dict:
+    job = await jobs.queue.get(job_id)
+    # Jobs are private to whoever submitted them; admin sees all
+    if not job or (job["usuario"] != current_user.username and current_user.username != "admin"):
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@api_router.get("/trabajos/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    return await get_visible_job(job_id, current_user)
+
+@api_router.get("/trabajos/{job_id}/resultado")
+async def download_job_result(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await get_visible_job(job_id, current_user)
+    if job["estado"] != "completado":
+        raise HTTPException(status_code=409, detail=f"El trabajo no ha terminado (estado: {job['estado']})")
+    result = await jobs.queue.get_result(job_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="El resultado ha caducado")
+    return Response(
+        content=result["content"],
+        media_type=job["resultado"]["media_type"],
+        headers={"Content-Disposition": f'attachment; filename="{job["resultado"]["filename"]}"'}
+    )
+
+# Health endpoints (no authentication, outside /api so load balancers can reach them directly)
+@app.get("/healthz")
+async def liveness():
+    # Event loop lag is the only dependency of a live worker
+    started = time.perf_counter()
+    await asyncio.sleep(0)
+    return {
+        "status": "ok",
+        "uptime_s": round(time.time() - startup_state["started_at"], 1),
+        "checks": {
+            "event_loop": {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+        }
+    }
+
+@app.get("/readyz")
+async def readiness():
+    checks = {}
+    
+    try:
+        latency_ms = await asyncio.wait_for(database.ping(), timeout=READINESS_PING_TIMEOUT_SECONDS)
+        checks["mongo"] = {"ok": True, "latency_ms": round(latency_ms, 3)}
+    except asyncio.TimeoutError:
+        checks["mongo"] = {"ok": False, "error": f"ping > {READINESS_PING_TIMEOUT_SECONDS}s"}
+    except Exception as e:
+        checks["mongo"] = {"ok": False, "error": str(e)}
+    
+    checks["indexes"] = {
+        "ok": startup_state["indexes_ms"] is not None,
+        "latency_ms": startup_state["indexes_ms"] and round(startup_state["indexes_ms"], 3)
+    }
+    checks["pool_warm"] = {
+        "ok": startup_state["pool_warm_ms"] is not None,
+        "latency_ms": startup_state["pool_warm_ms"] and round(startup_state["pool_warm_ms"], 3)
+    }
+    
+    ready = all(check["ok"] for check in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ok" if ready else "unavailable", "checks": checks}
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -599,13 +1477,111 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(profiling.ProfileMiddleware, authorize=is_admin_request)
+
+# Added last, so these wrap everything else: metrics latency and size cover compression
+# and profiling, and the access log (outermost) also times the metrics middleware
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(access_log.AccessLogMiddleware)
+
+# Configure logging (queued, see access_log.py)
+access_log.configure_logging(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def ensure_indexes():
+    # Runs in the lifespan before the worker accepts traffic; create_index is a no-op when present
+    await db.clients.create_index("id")
+    await db.clients.create_index("cif")
+    for keys in ([("nombre", 1), ("id", 1)], "nombre_busqueda", "cif_busqueda"):
+        await ensure_live_index(db.clients, keys)
+    await run_migration("deleted_at", backfill_deleted_at)
+    # Reads validate work centers against WorkCenter; entries stored before that would fail them
+    await run_migration("centros_trabajo", lambda: repair_work_centers.repair_work_centers(db))
+    await db.equipment.create_index("id")
+    # Workflow lookups only ever want live equipment: partial indexes skip deleted units
+    for keys in (
+        "cliente_id", [("cliente_id", 1), ("centro_trabajo_id", 1)], "estado", "numero_orden_compra",
+        # Range exports walk these in order
+        [("created_at", 1), ("id", 1)], [("updated_at", 1), ("id", 1)],
+    ):
+        await ensure_live_index(db.equipment, keys)
+    await db.purchase_orders.create_index("numero_orden")
+    await db.equipment_archive.create_index("id")
+    await db.equipment_archive.create_index([("updated_at", -1), ("id", 1)])
+    await db.equipment_archive.create_index([("cliente_id", 1), ("updated_at", -1)])
+    await db.equipment_archive.create_index("numero_serie")
+    await db.equipment_archive.create_index("orden_trabajo")
+    await db.equipment_archive.create_index("numero_orden_compra")
+    for collection in SOFT_DELETE_COLLECTIONS:
+        await ensure_purge_index(db[collection])
+    await db.jobs.create_index("id")
+    await db.jobs.create_index([("tipo", 1), ("created_at", -1)])
+    # At most one unfinished job per exclusive key (jobs.JobQueue.submit)
+    await db.jobs.create_index("exclusivo", unique=True, partialFilterExpression={"exclusivo": {"$exists": True}})
+    await db.jobs.create_index("created_at", expireAfterSeconds=jobs.RETENTION_SECONDS)
+    await db.job_results.create_index("job_id")
+    await db.job_results.create_index("created_at", expireAfterSeconds=jobs.RETENTION_SECONDS)
+    await db.export_cache.create_index("hash", unique=True)
+    await db.export_cache.create_index("created_at", expireAfterSeconds=packing_list.CACHE_TTL_SECONDS)
+    await backfill_client_search_keys()
+
+SOFT_DELETE_COLLECTIONS = ("equipment", "clients", "manufacturers", "models", "fault_types")
+
+async def ensure_live_index(collection, keys):
+    # Replaces the full index of the same keys created before soft delete existed
+    name = "_".join(f"{field}_{direction}" for field, direction in (
+        [(keys, 1)] if isinstance(keys, str) else keys
+    ))
+    try:
+        await collection.create_index(keys, name=f"{name}_live", partialFilterExpression=NOT_DELETED)
+    except OperationFailure:
+        # Built with an older partial filter; the index is rebuilt with the current one
+        await collection.drop_index(f"{name}_live")
+        await collection.create_index(keys, name=f"{name}_live", partialFilterExpression=NOT_DELETED)
+    if name in await collection.index_information():
+        await collection.drop_index(name)
+
+async def ensure_purge_index(collection):
+    # TTL purge of soft-deleted documents; the partial filter keeps the index to deleted ones only
+    seconds = SOFT_DELETE_RETENTION_DAYS * 86400
+    try:
+        await collection.create_index(
+            "deleted_at", name="deleted_at_ttl", expireAfterSeconds=seconds,
+            partialFilterExpression={"deleted_at": {"$type": "date"}}
+        )
+    except OperationFailure:
+        # SOFT_DELETE_RETENTION_DAYS changed since the index was created
+        await db.command("collMod", collection.name, index={"name": "deleted_at_ttl", "expireAfterSeconds": seconds})
+
+async def run_migration(name: str, migrate):
+    # One-off data fixes scan whole collections, so each runs once and leaves a marker behind
+    if await db.migrations.find_one({"id": name}):
+        return
+    await migrate()
+    await db.migrations.update_one(
+        {"id": name}, {"$setOnInsert": {"id": name, "applied_at": datetime.utcnow()}}, upsert=True
+    )
+
+async def backfill_deleted_at():
+    # Documents written before soft delete get an explicit null so NOT_DELETED matches them
+    for collection in SOFT_DELETE_COLLECTIONS:
+        await db[collection].update_many({"deleted_at": {"$exists": False}}, {"$set": {"deleted_at": None}})
+
+async def backfill_client_search_keys(batch_size: int = 500, query: Optional[dict] = None):
+    # Clients created before search keys existed get them once, in batches
+    # (maintenance.py passes query={} to recompute them all)
+    pending = []
+    if query is None:
+        query = {"nombre_busqueda": {"$exists": False}}
+    cursor = db.clients.find(query, {"_id": 0, "id": 1, "nombre": 1, "cif": 1})
+    async for client in cursor:
+        pending.append(UpdateOne(
+            {"id": client["id"]},
+            {"$set": client_search_keys(client.get("nombre"), client.get("cif"))}
+        ))
+        if len(pending) >= batch_size:
+            await db.clients.bulk_write(pending, ordered=False)
+            pending = []
+    if pending:
+        await db.clients.bulk_write(pending, ordered=False)
@@ -0,0 +1,172 @@
+"""Slow Mongo operation log and explain-plan helpers.
+
+`SlowQueryListener` logs every command slower than MONGO_SLOW_QUERY_MS
+(default 100) with its collection, duration, documents returned and the
+shape of its filter, with literal values redacted. For slow reads it also
+re-runs the command through `explain` (executionStats) in the background,
+one at a time, to report documents examined and whether it scanned the
+whole collection. Set MONGO_SLOW_QUERY_EXPLAIN=0 to skip that step.
+"""
+import asyncio
+import logging
+import os
+import threading
+
+from pymongo import monitoring
+
+import database
+
+logger = logging.getLogger("slow_queries")
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+# Command fields added by the driver/session that are not part of the query itself
+DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+# Longer lists (e.g. $in with thousands of ids) are cut, noting how many items were left out
+MAX_REDACTED_ITEMS = 10
+
+
+def redact(value):
+    """Replace literal values with "?" while keeping field names and operators."""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return redact_items(value)
+    return "?"
+
+
+def redact_items(items) -> list:
+    shape = [redact(item) for item in items[:MAX_REDACTED_ITEMS]]
+    if len(items) > MAX_REDACTED_ITEMS:
+        shape.append(f"... +{len(items) - MAX_REDACTED_ITEMS}")
+    return shape
+
+
+def collection_name(command_name: str, command: dict):
+    target = command.get(command_name)
+    return target if isinstance(target, str) else command.get("collection")
+
+
+def filter_shape(command_name: str, command: dict):
+    if command_name in ("find", "count", "distinct"):
+        return redact(command.get("filter", command.get("query", {})))
+    if command_name == "aggregate":
+        return [{stage: redact(spec) for stage, spec in step.items()} for step in command.get("pipeline", [])]
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        if len(statements) <= 1:
+            return redact(statements[0].get("q", {})) if statements else {}
+        return redact_items([statement.get("q", {}) for statement in statements])
+    return None
+
+
+def documents_returned(command_name: str, reply: dict):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name in ("count", "update", "delete", "insert"):
+        return reply.get("n")
+    return None
+
+
+def plan_stages(plan: dict) -> list:
+    """Flatten an explain plan tree into its stage names, root first."""
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", []))
+        if "queryPlan" in node:
+            pending.append(node["queryPlan"])
+    return stages
+
+
+def summarize_explain(explain: dict) -> dict:
+    # Aggregations nest the find-layer explain inside their first $cursor stage
+    if "queryPlanner" not in explain:
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                explain = stage["$cursor"]
+                break
+    planner = explain.get("queryPlanner", {})
+    stats = explain.get("executionStats", {})
+    stages = plan_stages(planner.get("winningPlan", {}))
+    return {
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+    }
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    def __init__(self, loop=None, threshold_ms=None, explain=None):
+        self.threshold_ms = threshold_ms if threshold_ms is not None else float(os.environ.get("MONGO_SLOW_QUERY_MS", "100"))
+        self.explain = explain if explain is not None else os.environ.get("MONGO_SLOW_QUERY_EXPLAIN", "1") != "0"
+        self.loop = loop
+        self._commands = {}
+        self._lock = threading.Lock()
+        self._explain_pending = False
+
+    def started(self, event):
+        if event.command_name == "explain":
+            return
+        command = {
+            key: value for key, value in event.command.items()
+            if not key.startswith("$") and key not in DRIVER_FIELDS
+        }
+        with self._lock:
+            self._commands[(event.connection_id, event.request_id)] = (event.database_name, command)
+
+    def succeeded(self, event):
+        self._finish(event, getattr(event, "reply", {}) or {})
+
+    def failed(self, event):
+        self._finish(event, {})
+
+    def _finish(self, event, reply: dict):
+        with self._lock:
+            started = self._commands.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if started is None or duration_ms < self.threshold_ms:
+            return
+
+        database_name, command = started
+        entry = {
+            "command": event.command_name,
+            "collection": collection_name(event.command_name, command),
+            "duration_ms": round(duration_ms, 1),
+            "filter": filter_shape(event.command_name, command),
+            "returned": documents_returned(event.command_name, reply),
+        }
+        if self.explain and self.loop and event.command_name in EXPLAINABLE_COMMANDS and self._claim_explain():
+            asyncio.run_coroutine_threadsafe(self._explain_and_log(database_name, command, entry), self.loop)
+        else:
+            logger.warning("Slow Mongo operation: %s", entry)
+
+    def _claim_explain(self) -> bool:
+        # At most one explain in flight; further slow queries are logged without one
+        with self._lock:
+            if self._explain_pending:
+                return False
+            self._explain_pending = True
+            return True
+
+    async def _explain_and_log(self, database_name: str, command: dict, entry: dict):
+        try:
+            explain = await database.client[database_name].command(
+                {"explain": command, "verbosity": "executionStats"}
+            )
+            entry.update(summarize_explain(explain))
+        except Exception as e:
+            entry["explain_error"] = str(e)
+        finally:
+            with self._lock:
+                self._explain_pending = False
+        logger.warning("Slow Mongo operation: %s", entry)
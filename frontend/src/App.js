@@ -582,16 +582,27 @@ function App() {
 
   const exportToCSV = async (orderNumber) => {
     try {
-      const response = await axios.get(`${API}/ordenes-compra/${orderNumber}/export-csv`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
+      const headers = { Authorization: `Bearer ${token}` };
+      // The export runs as a background job: submit it, poll its status, then download the result
+      let job = (await axios.post(`${API}/ordenes-compra/${orderNumber}/export-csv`, {}, { headers })).data;
+      // Give up after two minutes instead of polling a stuck job forever
+      for (let attempt = 0; attempt < 120 && (job.estado === 'pendiente' || job.estado === 'en_curso'); attempt++) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = (await axios.get(`${API}/trabajos/${job.id}`, { headers })).data;
+      }
+      if (job.estado === 'pendiente' || job.estado === 'en_curso') {
+        throw new Error('tiempo de espera agotado');
+      }
+      if (job.estado !== 'completado') {
+        throw new Error(job.error || job.estado);
+      }
+      const response = await axios.get(`${API}/trabajos/${job.id}/resultado`, { headers, responseType: 'blob' });
 
-      // Create and download CSV file
-      const blob = new Blob([response.data.content], { type: 'text/csv' });
-      const url = window.URL.createObjectURL(blob);
+      // Download CSV file
+      const url = window.URL.createObjectURL(response.data);
       const a = document.createElement('a');
       a.href = url;
-      a.download = response.data.filename;
+      a.download = job.resultado.filename;
       a.click();
       window.URL.revokeObjectURL(url);
     } catch (error) {
@@ -600,6 +611,24 @@ function App() {
     }
   };
 
+  const exportPackingList = async (orderNumber, format) => {
+    try {
+      const response = await axios.get(`${API}/ordenes-compra/${orderNumber}/packing-list/${format}`, {
+        headers: { Authorization: `Bearer ${token}` },
+        responseType: 'blob'
+      });
+      const url = window.URL.createObjectURL(response.data);
+      const a = document.createElement('a');
+      a.href = url;
+      a.download = `packing_list_${orderNumber}.${format}`;
+      a.click();
+      window.URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error('Error exporting packing list:', error);
+      alert(`Error al exportar ${format.toUpperCase()}`);
+    }
+  };
+
   const addManufacturer = async () => {
     if (!newManufacturer.trim()) return;
     try {
@@ -1441,10 +1470,20 @@ function App() {
                       </SelectContent>
                     </Select>
                     {selectedPurchaseOrder && (
-                      <Button onClick={() => exportToCSV(selectedPurchaseOrder)}>
-                        <Download className="h-4 w-4 mr-2" />
-                        Exportar CSV
-                      </Button>
+                      <>
+                        <Button onClick={() => exportToCSV(selectedPurchaseOrder)}>
+                          <Download className="h-4 w-4 mr-2" />
+                          Exportar CSV
+                        </Button>
+                        <Button variant="outline" onClick={() => exportPackingList(selectedPurchaseOrder, 'xlsx')}>
+                          <Download className="h-4 w-4 mr-2" />
+                          Exportar XLSX
+                        </Button>
+                        <Button variant="outline" onClick={() => exportPackingList(selectedPurchaseOrder, 'pdf')}>
+                          <Download className="h-4 w-4 mr-2" />
+                          Packing list PDF
+                        </Button>
+                      </>
                     )}
                   </div>
 